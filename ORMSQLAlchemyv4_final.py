@@ -1,37 +1,65 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey, Table
-from sqlalchemy.orm import relationship, sessionmaker, declarative_base
-from tabulate import tabulate
+import argparse
+import bz2
+import csv
+import gzip
+import json
+import lzma
+import operator
+import os
+import re
+import sqlite3
+import string
+import sys
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import Sequence
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import groupby, islice
+from sqlalchemy import (create_engine, event, Column, Integer, String, Boolean, ForeignKey, Table, Index, select, func,
+                        insert, delete, and_, or_, text, union, except_)
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.orm import Session, relationship, sessionmaker, declarative_base
 
 Base = declarative_base()
 
 # Tabela associativa entre Artista e Álbum (Relacionamento N:N)
 artista_album = Table('artista_album', Base.metadata,
-                      Column('artista_id', Integer, ForeignKey('artistas.id'), primary_key=True),
-                      Column('album_id', Integer, ForeignKey('albuns.id'), primary_key=True)
+                      Column('artista_id', Integer, ForeignKey('artistas.id', ondelete='CASCADE'), primary_key=True),
+                      Column('album_id', Integer, ForeignKey('albuns.id', ondelete='CASCADE'), primary_key=True),
+                      # A chave primária já cobre a busca por artista; este índice cobre a busca reversa por álbum
+                      Index('ix_artista_album_album_id', 'album_id')
                       )
 
 # Tabela associativa entre Artista e Música (Relacionamento N:N para coletâneas)
 artista_musica = Table('artista_musica', Base.metadata,
-                       Column('artista_id', Integer, ForeignKey('artistas.id'), primary_key=True),
-                       Column('musica_id', Integer, ForeignKey('musicas.id'), primary_key=True)
+                       Column('artista_id', Integer, ForeignKey('artistas.id', ondelete='CASCADE'), primary_key=True),
+                       Column('musica_id', Integer, ForeignKey('musicas.id', ondelete='CASCADE'), primary_key=True),
+                       Index('ix_artista_musica_musica_id', 'musica_id')
                        )
 
 # Classes do modelo de dados
+# As exclusões em cascata ficam no próprio banco (ON DELETE CASCADE / SET NULL); com passive_deletes=True o
+# ORM não carrega as músicas e associações de um registro só para excluí-las ou desvinculá-las
 class Artista(Base):
     __tablename__ = 'artistas'
     id = Column(Integer, primary_key=True)
     nome = Column(String, nullable=False)
-    albuns = relationship('Album', secondary=artista_album, back_populates='artistas')
-    musicas = relationship('Musica', secondary=artista_musica, back_populates='artistas')
+    albuns = relationship('Album', secondary=artista_album, back_populates='artistas', passive_deletes=True)
+    musicas = relationship('Musica', secondary=artista_musica, back_populates='artistas', passive_deletes=True)
+    __table_args__ = (Index('ix_artistas_nome_nocase', nome.collate('NOCASE')),)
 
 class Album(Base):
     __tablename__ = 'albuns'
     id = Column(Integer, primary_key=True)
     nome = Column(String, nullable=False)
     ano_lancamento = Column(Integer)
-    coletanea = Column(Boolean, default=False)
-    musicas = relationship('Musica', back_populates='album', cascade="all, delete-orphan")
-    artistas = relationship('Artista', secondary=artista_album, back_populates='albuns')
+    coletanea = Column(Boolean, default=False, index=True)
+    musicas = relationship('Musica', back_populates='album', cascade="all, delete-orphan", passive_deletes=True)
+    artistas = relationship('Artista', secondary=artista_album, back_populates='albuns', passive_deletes=True)
+    __table_args__ = (Index('ix_albuns_nome_nocase', nome.collate('NOCASE')),)
 
 class Musica(Base):
     __tablename__ = 'musicas'
@@ -39,22 +67,673 @@ class Musica(Base):
     nome = Column(String, nullable=False)
     duracao = Column(Integer)  # Duração da música em segundos
     faixa = Column(Integer)  # Número da faixa no álbum
-    album_id = Column(Integer, ForeignKey('albuns.id'))
-    genero_id = Column(Integer, ForeignKey('generos.id'))
+    album_id = Column(Integer, ForeignKey('albuns.id', ondelete='CASCADE'), index=True)
+    genero_id = Column(Integer, ForeignKey('generos.id', ondelete='SET NULL'), index=True)
     album = relationship('Album', back_populates='musicas')
     genero = relationship('Genero', back_populates='musicas')
-    artistas = relationship('Artista', secondary=artista_musica, back_populates='musicas')
+    artistas = relationship('Artista', secondary=artista_musica, back_populates='musicas', passive_deletes=True)
+    __table_args__ = (Index('ix_musicas_nome_nocase', nome.collate('NOCASE')),)
 
 class Genero(Base):
     __tablename__ = 'generos'
     id = Column(Integer, primary_key=True)
     nome = Column(String, nullable=False)
-    musicas = relationship('Musica', back_populates='genero')
+    musicas = relationship('Musica', back_populates='genero', passive_deletes=True)
+    __table_args__ = (Index('ix_generos_nome_nocase', nome.collate('NOCASE')),)
+
+# Tabelas do catálogo (as tabelas de estatísticas, agregados e busca são derivadas delas)
+TABELAS_CATALOGO = (Artista.__table__, Album.__table__, Genero.__table__, Musica.__table__,
+                    artista_album, artista_musica)
+
+# Tabelas de estatísticas do catálogo, mantidas incrementalmente pelos gatilhos (triggers) abaixo
+# Total de registros por tabela
+estatisticas_tabelas = Table('estatisticas_tabelas', Base.metadata,
+                             Column('tabela', String, primary_key=True),
+                             Column('total', Integer, nullable=False, default=0)
+                             )
+
+# Colunas de duração dos totais: soma das durações e quantidade de músicas com duração
+# (a duração média é duracao_total / musicas_com_duracao; músicas sem duração não entram na média)
+def _colunas_duracao():
+    return [Column(nome, Integer, nullable=False, server_default='0')
+            for nome in ('duracao_total', 'musicas_com_duracao')]
+
+# Total de músicas e duração por gênero (genero_id 0 agrupa as músicas sem gênero)
+estatisticas_generos = Table('estatisticas_generos', Base.metadata,
+                             Column('genero_id', Integer, primary_key=True, autoincrement=False),
+                             Column('musicas', Integer, nullable=False, default=0),
+                             *_colunas_duracao()
+                             )
+
+# Total de álbuns, de músicas e duração por ano de lançamento do álbum (ano 0 agrupa os álbuns sem ano)
+estatisticas_anos = Table('estatisticas_anos', Base.metadata,
+                          Column('ano', Integer, primary_key=True, autoincrement=False),
+                          Column('albuns', Integer, nullable=False, default=0),
+                          Column('musicas', Integer, nullable=False, default=0),
+                          *_colunas_duracao()
+                          )
+
+def _gatilhos_total_tabela(tabela):
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS tg_estatisticas_{tabela}_insert AFTER INSERT ON {tabela}
+        BEGIN
+            INSERT INTO estatisticas_tabelas (tabela, total) VALUES ('{tabela}', 1)
+            ON CONFLICT (tabela) DO UPDATE SET total = total + 1;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS tg_estatisticas_{tabela}_delete AFTER DELETE ON {tabela}
+        BEGIN
+            UPDATE estatisticas_tabelas SET total = total - 1 WHERE tabela = '{tabela}';
+        END""",
+    ]
+
+# Chave de ano das estatísticas: anos gravados como texto são convertidos para inteiro, e os que não são
+# numéricos contam junto com os álbuns sem ano (0)
+def _chave_ano(coluna):
+    return f"IFNULL(CAST({coluna} AS INTEGER), 0)"
+
+_SOMAR_TOTAIS = """musicas = musicas + excluded.musicas, duracao_total = duracao_total + excluded.duracao_total,
+            musicas_com_duracao = musicas_com_duracao + excluded.musicas_com_duracao"""
+
+# Comandos que somam (sinal '+') ou subtraem (sinal '-') a música NEW/OLD nos totais do gênero e do ano do
+# álbum (músicas sem álbum não contam em nenhum ano)
+def _somar_musica_estatisticas(linha, sinal):
+    return f"""INSERT INTO estatisticas_generos (genero_id, musicas, duracao_total, musicas_com_duracao)
+        VALUES (IFNULL({linha}.genero_id, 0), {sinal}1, {sinal}IFNULL({linha}.duracao, 0),
+                {sinal}({linha}.duracao IS NOT NULL))
+        ON CONFLICT (genero_id) DO UPDATE SET {_SOMAR_TOTAIS};
+        INSERT INTO estatisticas_anos (ano, albuns, musicas, duracao_total, musicas_com_duracao)
+        SELECT {_chave_ano('ano_lancamento')}, 0, {sinal}1, {sinal}IFNULL({linha}.duracao, 0),
+               {sinal}({linha}.duracao IS NOT NULL)
+        FROM albuns WHERE id = {linha}.album_id
+        ON CONFLICT (ano) DO UPDATE SET {_SOMAR_TOTAIS};"""
+
+# Comando que soma ou subtrai o álbum NEW/OLD, com as músicas que ele tiver, nos totais do ano
+def _somar_album_estatisticas(linha, sinal):
+    return f"""INSERT INTO estatisticas_anos (ano, albuns, musicas, duracao_total, musicas_com_duracao)
+        SELECT {_chave_ano(f'{linha}.ano_lancamento')}, {sinal}1, {sinal}COUNT(*), {sinal}IFNULL(SUM(duracao), 0),
+               {sinal}COUNT(duracao)
+        FROM musicas WHERE album_id = {linha}.id
+        ON CONFLICT (ano) DO UPDATE SET albuns = albuns + excluded.albuns, {_SOMAR_TOTAIS};"""
+
+# Gatilhos que mantêm as estatísticas atualizadas a cada INSERT, UPDATE ou DELETE, inclusive nas
+# gravações em massa feitas fora do ORM. As músicas contam no ano do álbum ao qual pertencem.
+GATILHOS_ESTATISTICAS = [
+    *_gatilhos_total_tabela('artistas'),
+    *_gatilhos_total_tabela('albuns'),
+    *_gatilhos_total_tabela('musicas'),
+    *_gatilhos_total_tabela('generos'),
+    f"""CREATE TRIGGER IF NOT EXISTS tg_estatisticas_musicas_totais_insert AFTER INSERT ON musicas
+    BEGIN
+        {_somar_musica_estatisticas('NEW', '+')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tg_estatisticas_musicas_totais_delete AFTER DELETE ON musicas
+    BEGIN
+        {_somar_musica_estatisticas('OLD', '-')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tg_estatisticas_musicas_totais_update
+    AFTER UPDATE OF album_id, genero_id, duracao ON musicas
+    WHEN OLD.album_id IS NOT NEW.album_id OR OLD.genero_id IS NOT NEW.genero_id OR OLD.duracao IS NOT NEW.duracao
+    BEGIN
+        {_somar_musica_estatisticas('OLD', '-')}
+        {_somar_musica_estatisticas('NEW', '+')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tg_estatisticas_albuns_ano_insert AFTER INSERT ON albuns
+    BEGIN
+        {_somar_album_estatisticas('NEW', '+')}
+    END""",
+    # BEFORE: as músicas que ainda pertencem ao álbum são descontadas junto com ele
+    f"""CREATE TRIGGER IF NOT EXISTS tg_estatisticas_albuns_ano_delete BEFORE DELETE ON albuns
+    BEGIN
+        {_somar_album_estatisticas('OLD', '-')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tg_estatisticas_albuns_ano_update AFTER UPDATE OF ano_lancamento ON albuns
+    WHEN OLD.ano_lancamento IS NOT NEW.ano_lancamento
+    BEGIN
+        {_somar_album_estatisticas('OLD', '-')}
+        {_somar_album_estatisticas('NEW', '+')}
+    END""",
+]
+
+# Consultas que calculam os totais por gênero e por ano a partir das tabelas originais, na mesma ordem de
+# colunas das tabelas de estatísticas; usadas para reconstruí-las e para verificar a consistência
+def consultas_estatisticas():
+    duracao = (func.coalesce(func.sum(Musica.duracao), 0), func.count(Musica.duracao))
+    genero = func.ifnull(Musica.genero_id, 0)
+    ano = func.ifnull(Album.ano_lancamento.cast(Integer), 0)
+    return {
+        estatisticas_generos: select(genero, func.count(), *duracao).group_by(genero),
+        estatisticas_anos: (
+            select(ano, func.count(func.distinct(Album.id)), func.count(Musica.id), *duracao)
+            .select_from(Album)
+            .outerjoin(Musica, Musica.album_id == Album.id)
+            .group_by(ano)
+        ),
+    }
+
+# Função para recalcular do zero as tabelas de estatísticas (usada quando elas acabam de ser criadas)
+def rebuild_estatisticas(conexao):
+    conexao.execute(estatisticas_tabelas.delete())
+    for entidade in (Artista, Album, Musica, Genero):
+        conexao.execute(insert(estatisticas_tabelas).values(
+            tabela=entidade.__tablename__, total=select(func.count()).select_from(entidade).scalar_subquery()))
+    for tabela, consulta in consultas_estatisticas().items():
+        conexao.execute(tabela.delete())
+        conexao.execute(insert(tabela).from_select([coluna.name for coluna in tabela.c], consulta))
+
+# Função para criar as tabelas e os gatilhos de estatísticas e preenchê-las (passo de migração do esquema)
+def setup_estatisticas(conexao):
+    for tabela in (estatisticas_tabelas, estatisticas_generos, estatisticas_anos):
+        tabela.create(conexao, checkfirst=True)
+    for gatilho in GATILHOS_ESTATISTICAS:
+        conexao.exec_driver_sql(gatilho)
+    rebuild_estatisticas(conexao)
+
+# Tabelas de agregados materializados (quantidade de músicas e duração total) por álbum e artista, mantidas
+# incrementalmente pelos gatilhos abaixo para que os relatórios leiam uma linha por entidade. Os totais por
+# gênero e por ano ficam nas tabelas de estatísticas.
+def _colunas_agregados():
+    return [Column('musicas', Integer, nullable=False, server_default='0'), *_colunas_duracao()]
+
+agregados_albuns = Table('agregados_albuns', Base.metadata,
+                         Column('album_id', Integer, primary_key=True, autoincrement=False),
+                         *_colunas_agregados()
+                         )
+
+# As músicas de um artista são as ligadas a ele em artista_musica; albuns conta as ligações em artista_album
+agregados_artistas = Table('agregados_artistas', Base.metadata,
+                           Column('artista_id', Integer, primary_key=True, autoincrement=False),
+                           Column('albuns', Integer, nullable=False, server_default='0'),
+                           *_colunas_agregados()
+                           )
+
+# Comando que soma (sinal '+') ou subtrai (sinal '-') uma música em um agregado; a origem é um SELECT que
+# devolve as colunas chave e duracao (nenhuma linha ou chave nula: nada a fazer)
+def _acumular_musica(tabela, chave, origem, sinal):
+    return f"""INSERT INTO {tabela} ({chave}, musicas, duracao_total, musicas_com_duracao)
+        SELECT chave, {sinal}1, {sinal}IFNULL(duracao, 0), {sinal}(duracao IS NOT NULL) FROM ({origem})
+        WHERE chave IS NOT NULL
+        ON CONFLICT ({chave}) DO UPDATE SET {_SOMAR_TOTAIS};"""
+
+# Comando que soma ou subtrai a música NEW/OLD no agregado do álbum. Só é feito se o álbum ainda existir
+# (numa exclusão em cascata, o álbum já foi removido junto com o agregado dele).
+def _acumular_musica_album(linha, sinal):
+    return _acumular_musica('agregados_albuns', 'album_id',
+                            f"SELECT id AS chave, {linha}.duracao AS duracao FROM albuns WHERE id = {linha}.album_id",
+                            sinal)
+
+# Comando que soma ou subtrai a ligação NEW/OLD de artista_musica no agregado do artista.
+# Se a música já não existir (exclusão em cascata), só a contagem é alterada: a duração já foi descontada
+# pelo gatilho BEFORE DELETE da música.
+def _acumular_artista_musica(linha, sinal):
+    return _acumular_musica('agregados_artistas', 'artista_id',
+                            f"SELECT id AS chave, (SELECT duracao FROM musicas WHERE id = {linha}.musica_id) AS duracao "
+                            f"FROM artistas WHERE id = {linha}.artista_id", sinal)
+
+# Comando que soma ou subtrai uma ligação de artista_album na contagem de álbuns do artista
+def _acumular_artista_album(linha, sinal):
+    return f"""INSERT INTO agregados_artistas (artista_id, albuns) SELECT id, {sinal}1 FROM artistas WHERE id = {linha}.artista_id
+        ON CONFLICT (artista_id) DO UPDATE SET albuns = albuns + excluded.albuns;"""
+
+# Comando que ajusta a duração da música nos agregados dos artistas ligados a ela
+def _ajustar_duracao_artistas(musica_id, duracao_antiga, duracao_nova):
+    return f"""UPDATE agregados_artistas
+        SET duracao_total = duracao_total - IFNULL({duracao_antiga}, 0) + IFNULL({duracao_nova}, 0),
+            musicas_com_duracao = musicas_com_duracao - ({duracao_antiga} IS NOT NULL) + ({duracao_nova} IS NOT NULL)
+        WHERE artista_id IN (SELECT artista_id FROM artista_musica WHERE musica_id = {musica_id});"""
+
+# Gatilhos que mantêm os agregados a cada INSERT, UPDATE ou DELETE em músicas, álbuns, artistas e ligações,
+# inclusive nas exclusões em cascata feitas pelo próprio SQLite
+GATILHOS_AGREGADOS = [
+    f"""CREATE TRIGGER IF NOT EXISTS tg_agregados_musicas_insert AFTER INSERT ON musicas
+    BEGIN
+        {_acumular_musica_album('NEW', '+')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tg_agregados_musicas_delete AFTER DELETE ON musicas
+    BEGIN
+        {_acumular_musica_album('OLD', '-')}
+    END""",
+    # Antes de excluir a música, desconta a duração dela dos artistas que ainda estão ligados a ela
+    f"""CREATE TRIGGER IF NOT EXISTS tg_agregados_musicas_artistas_delete BEFORE DELETE ON musicas
+    BEGIN
+        {_ajustar_duracao_artistas('OLD.id', 'OLD.duracao', 'NULL')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tg_agregados_musicas_update AFTER UPDATE OF album_id, duracao ON musicas
+    WHEN OLD.album_id IS NOT NEW.album_id OR OLD.duracao IS NOT NEW.duracao
+    BEGIN
+        {_acumular_musica_album('OLD', '-')}
+        {_acumular_musica_album('NEW', '+')}
+        {_ajustar_duracao_artistas('NEW.id', 'OLD.duracao', 'NEW.duracao')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tg_agregados_artista_musica_insert AFTER INSERT ON artista_musica
+    BEGIN
+        {_acumular_artista_musica('NEW', '+')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tg_agregados_artista_musica_delete AFTER DELETE ON artista_musica
+    BEGIN
+        {_acumular_artista_musica('OLD', '-')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tg_agregados_artista_album_insert AFTER INSERT ON artista_album
+    BEGIN
+        {_acumular_artista_album('NEW', '+')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tg_agregados_artista_album_delete AFTER DELETE ON artista_album
+    BEGIN
+        {_acumular_artista_album('OLD', '-')}
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tg_agregados_albuns_delete AFTER DELETE ON albuns
+    BEGIN
+        DELETE FROM agregados_albuns WHERE album_id = OLD.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tg_agregados_artistas_delete AFTER DELETE ON artistas
+    BEGIN
+        DELETE FROM agregados_artistas WHERE artista_id = OLD.id;
+    END""",
+]
+
+# Consultas que calculam os agregados a partir das tabelas originais, na mesma ordem de colunas das tabelas
+# de agregados; usadas para reconstruí-los e para verificar a consistência
+def consultas_agregados():
+    def totais(*chave):
+        return select(*chave, func.count(), func.coalesce(func.sum(Musica.duracao), 0), func.count(Musica.duracao))
+
+    albuns_por_artista = (select(artista_album.c.artista_id, func.count().label('albuns'))
+                          .group_by(artista_album.c.artista_id).subquery())
+    musicas_por_artista = (
+        totais(artista_musica.c.artista_id)
+        .select_from(artista_musica)
+        .outerjoin(Musica, Musica.id == artista_musica.c.musica_id)
+        .group_by(artista_musica.c.artista_id)
+        .subquery()
+    )
+    return {
+        agregados_albuns: totais(Musica.album_id).join(Album, Album.id == Musica.album_id).group_by(Musica.album_id),
+        agregados_artistas: (
+            select(Artista.id, func.ifnull(albuns_por_artista.c.albuns, 0),
+                   *[func.ifnull(coluna, 0) for coluna in list(musicas_por_artista.c)[1:]])
+            .outerjoin(albuns_por_artista, albuns_por_artista.c.artista_id == Artista.id)
+            .outerjoin(musicas_por_artista, musicas_por_artista.c.artista_id == Artista.id)
+        ),
+    }
+
+# Função para recalcular do zero as tabelas de agregados
+def rebuild_agregados(conexao):
+    for tabela, consulta in consultas_agregados().items():
+        conexao.execute(tabela.delete())
+        conexao.execute(insert(tabela).from_select([coluna.name for coluna in tabela.c], consulta))
+
+# Função que compara os agregados e os totais por gênero e por ano gravados com os calculados a partir das
+# tabelas originais e devolve, por tabela, as chaves divergentes (linhas zeradas são equivalentes a linhas ausentes)
+def check_agregados(conexao):
+    divergencias = {}
+    for tabela, consulta in {**consultas_estatisticas(), **consultas_agregados()}.items():
+        calculados = consulta.subquery()
+        gravados = select(*tabela.c).where(or_(*[coluna != 0 for coluna in list(tabela.c)[1:]]))
+        esperados = select(*calculados.c).where(or_(*[coluna != 0 for coluna in list(calculados.c)[1:]]))
+        diferencas = union(select(except_(esperados, gravados).subquery().c[0]),
+                           select(except_(gravados, esperados).subquery().c[0])).subquery()
+        chaves = conexao.execute(select(diferencas.c[0]).order_by(diferencas.c[0])).scalars().all()
+        if chaves:
+            divergencias[tabela.name] = chaves
+    return divergencias
+
+# Função para criar as tabelas e os gatilhos de agregados e preenchê-las (passo de migração do esquema)
+def setup_agregados(conexao):
+    for tabela in (agregados_albuns, agregados_artistas):
+        tabela.create(conexao, checkfirst=True)
+    for gatilho in GATILHOS_AGREGADOS:
+        conexao.exec_driver_sql(gatilho)
+    rebuild_agregados(conexao)
+
+# Tabelas virtuais FTS5 de busca textual por nome, no formato "external content": o índice aponta para as
+# linhas das tabelas originais (rowid = id) e é mantido em sincronia pelos gatilhos abaixo.
+# O tokenizador ignora acentos, então "musica" também encontra "Música".
+TABELAS_BUSCA = {'artistas': 'busca_artistas', 'albuns': 'busca_albuns', 'musicas': 'busca_musicas'}
+
+def _ddl_busca(tabela, tabela_busca):
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {tabela_busca} USING fts5(
+            nome, content='{tabela}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+        f"""CREATE TRIGGER IF NOT EXISTS tg_{tabela_busca}_insert AFTER INSERT ON {tabela}
+        BEGIN
+            INSERT INTO {tabela_busca} (rowid, nome) VALUES (NEW.id, NEW.nome);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS tg_{tabela_busca}_delete AFTER DELETE ON {tabela}
+        BEGIN
+            INSERT INTO {tabela_busca} ({tabela_busca}, rowid, nome) VALUES ('delete', OLD.id, OLD.nome);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS tg_{tabela_busca}_update AFTER UPDATE OF nome ON {tabela}
+        BEGIN
+            INSERT INTO {tabela_busca} ({tabela_busca}, rowid, nome) VALUES ('delete', OLD.id, OLD.nome);
+            INSERT INTO {tabela_busca} (rowid, nome) VALUES (NEW.id, NEW.nome);
+        END""",
+    ]
+
+# Função para criar as tabelas de busca e indexar os registros existentes (passo de migração do esquema)
+def setup_busca(conexao):
+    for tabela, tabela_busca in TABELAS_BUSCA.items():
+        for comando in _ddl_busca(tabela, tabela_busca):
+            conexao.exec_driver_sql(comando)
+        conexao.exec_driver_sql(f"INSERT INTO {tabela_busca} ({tabela_busca}) VALUES ('rebuild')")
+
+# Registro de alterações (change data feed) para a sincronização incremental de cópias do catálogo
+# Cada INSERT, UPDATE ou DELETE nas tabelas do catálogo grava, por gatilho (inclusive nas exclusões em cascata e
+# nas gravações em massa), uma linha com a chave do registro e um número de sequência crescente. O AUTOINCREMENT
+# garante que uma sequência nunca é reutilizada, mesmo depois da compactação. O registro guarda só as chaves:
+# os dados atuais dos registros são lidos junto com cada lote de alterações.
+alteracoes = Table('alteracoes', Base.metadata,
+                   Column('seq', Integer, primary_key=True),
+                   Column('tabela', String, nullable=False),
+                   Column('operacao', String(1), nullable=False),  # I (inclusão), U (alteração) ou D (exclusão)
+                   Column('chave', Integer, nullable=False),
+                   Column('chave2', Integer),  # Segunda coluna da chave nas tabelas associativas
+                   Column('registrada_em', Integer, nullable=False),  # Segundos desde 01/01/1970 (UTC)
+                   sqlite_autoincrement=True
+                   )
+
+# Maior sequência já descartada pela retenção (linha única); cursores anteriores a ela perderam alterações
+retencao_alteracoes = Table('retencao_alteracoes', Base.metadata,
+                            Column('id', Integer, primary_key=True, autoincrement=False),
+                            Column('descartadas_ate', Integer, nullable=False)
+                            )
+
+# Tabelas acompanhadas pelo registro de alterações
+TABELAS_ALTERACOES = {tabela.name: tabela for tabela in (Artista.__table__, Album.__table__, Musica.__table__,
+                                                         Genero.__table__, artista_album, artista_musica)}
+
+# Gatilhos de uma tabela; uma alteração da chave é registrada como exclusão da chave antiga e inclusão da nova
+def _gatilhos_alteracoes(tabela):
+    chaves = [coluna.name for coluna in tabela.primary_key]
+    colunas = ", ".join(['chave', 'chave2'][:len(chaves)])
+    mudou_chave = " OR ".join(f"OLD.{chave} IS NOT NEW.{chave}" for chave in chaves)
+
+    def registrar(operacao, linha, condicao=""):
+        valores = ", ".join(f"{linha}.{chave}" for chave in chaves)
+        return (f"INSERT INTO alteracoes (tabela, operacao, {colunas}, registrada_em) "
+                f"SELECT '{tabela.name}', {operacao}, {valores}, CAST(strftime('%s', 'now') AS INTEGER){condicao};")
+
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS tg_alteracoes_{tabela.name}_insert AFTER INSERT ON {tabela.name}
+        BEGIN
+            {registrar("'I'", 'NEW')}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS tg_alteracoes_{tabela.name}_delete AFTER DELETE ON {tabela.name}
+        BEGIN
+            {registrar("'D'", 'OLD')}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS tg_alteracoes_{tabela.name}_update AFTER UPDATE ON {tabela.name}
+        BEGIN
+            {registrar("'D'", 'OLD', f" WHERE {mudou_chave}")}
+            {registrar(f"CASE WHEN {mudou_chave} THEN 'I' ELSE 'U' END", 'NEW')}
+        END""",
+    ]
+
+# Função para criar o registro de alterações e os seus gatilhos (passo de migração do esquema)
+# Os registros já existentes não entram no registro: uma cópia nova começa por uma exportação completa e
+# continua a partir do cursor lido na mesma transação (ver cursor_alteracoes).
+def setup_alteracoes(conexao):
+    alteracoes.create(conexao, checkfirst=True)
+    retencao_alteracoes.create(conexao, checkfirst=True)
+    for tabela in TABELAS_ALTERACOES.values():
+        for gatilho in _gatilhos_alteracoes(tabela):
+            conexao.exec_driver_sql(gatilho)
+
+# Quantidade padrão de alterações lidas por lote
+LOTE_ALTERACOES = 1000
+
+# Função que devolve a maior sequência já registrada (0 se nenhuma), lida do sqlite_sequence sem percorrer o
+# registro. Lida na mesma transação de uma exportação, é o cursor a partir do qual a cópia exportada continua.
+def cursor_alteracoes(conexao):
+    return conexao.exec_driver_sql("SELECT seq FROM sqlite_sequence WHERE name = 'alteracoes'").scalar() or 0
+
+# Função que lê até `limite` alterações posteriores ao cursor `apos`, em ordem de sequência
+# Cada alteração traz a chave do registro e, nas inclusões e alterações, os dados atuais do registro (None se ele
+# já foi excluído; a exclusão vem mais adiante no registro). Inclusões e alterações devem ser aplicadas como
+# "upsert", pois a compactação pode deixar só a alteração de um registro que a cópia ainda não tem.
+# O custo depende só do tamanho do lote: o registro é lido pelo intervalo de sequências e os registros pela chave.
+def ler_alteracoes(conexao, apos=0, limite=LOTE_ALTERACOES):
+    descartadas = conexao.execute(select(retencao_alteracoes.c.descartadas_ate)).scalar() or 0
+    if apos < descartadas:
+        raise ValueError(f"O cursor {apos} é anterior às alterações já descartadas (até {descartadas}); "
+                         "faça uma sincronização completa a partir de uma exportação")
+    linhas = conexao.execute(select(alteracoes).where(alteracoes.c.seq > apos)
+                             .order_by(alteracoes.c.seq).limit(limite)).all()
+    if not linhas:
+        return []
+
+    dados = {}
+    for nome in {linha.tabela for linha in linhas if linha.operacao != 'D'}:
+        tabela = TABELAS_ALTERACOES[nome]
+        chaves = list(tabela.primary_key)
+        ligacao = [chaves[0] == alteracoes.c.chave] + ([chaves[1] == alteracoes.c.chave2] if len(chaves) > 1 else [])
+        consulta = (select(alteracoes.c.seq, tabela)
+                    .join(tabela, and_(*ligacao))
+                    .where(alteracoes.c.tabela == nome, alteracoes.c.operacao != 'D',
+                           alteracoes.c.seq.between(linhas[0].seq, linhas[-1].seq)))
+        for seq, *valores in conexao.execute(consulta):
+            dados[seq] = dict(zip(tabela.c.keys(), valores))
+
+    itens = []
+    for linha in linhas:
+        chaves = [coluna.name for coluna in TABELAS_ALTERACOES[linha.tabela].primary_key]
+        itens.append({'seq': linha.seq, 'tabela': linha.tabela, 'operacao': linha.operacao,
+                      'chave': dict(zip(chaves, (linha.chave, linha.chave2))), 'dados': dados.get(linha.seq),
+                      'registrada_em': linha.registrada_em})
+    return itens
+
+# Função que percorre as alterações posteriores ao cursor em lotes (cada lote em uma transação curta) até
+# alcançar o fim do registro; o cursor para continuar depois é o campo seq do último item
+def percorrer_alteracoes(engine, apos=0, lote=LOTE_ALTERACOES):
+    while True:
+        with engine.connect() as conexao:
+            itens = ler_alteracoes(conexao, apos, lote)
+        if not itens:
+            return
+        yield itens
+        apos = itens[-1]['seq']
+
+# Função que compacta o registro, mantendo só a alteração mais recente de cada registro (uma cópia que
+# aplica apenas ela chega ao mesmo estado); devolve a quantidade de alterações removidas
+def compactar_alteracoes(conexao):
+    recentes = (select(func.max(alteracoes.c.seq))
+                .group_by(alteracoes.c.tabela, alteracoes.c.chave, alteracoes.c.chave2))
+    return conexao.execute(delete(alteracoes).where(alteracoes.c.seq.not_in(recentes))).rowcount
+
+# Função que descarta as alterações registradas há mais de `dias` dias; cursores anteriores à última
+# alteração descartada deixam de ser aceitos. Devolve a quantidade de alterações descartadas.
+def descartar_alteracoes(conexao, dias):
+    limite = int(time.time()) - int(dias * 86400)
+    ultima = conexao.execute(select(func.max(alteracoes.c.seq))
+                             .where(alteracoes.c.registrada_em < limite)).scalar()
+    if ultima is None:
+        return 0
+    descartadas = conexao.execute(delete(alteracoes).where(alteracoes.c.seq <= ultima)).rowcount
+    conexao.execute(insert(retencao_alteracoes).prefix_with('OR REPLACE').values(id=1, descartadas_ate=ultima))
+    return descartadas
+
+# Endereço padrão do banco de dados
+URL_BANCO = 'sqlite:///musica_catalogo.db'
+
+# Perfis de desempenho do SQLite, aplicados por PRAGMA a cada nova conexão
+# - safe-interactive: WAL com synchronous NORMAL, sem fsync a cada commit e sem risco de corromper o banco
+#   (em caso de queda de energia, apenas as últimas transações podem ser perdidas)
+# - durable: WAL com fsync a cada commit
+# - bulk-load: para importações grandes; sem fsync e com cache e mmap maiores
+# - sqlite-default: mantém os padrões do SQLite (journal de rollback, fsync a cada commit)
+# Em todos os perfis as chaves estrangeiras ficam ativas, pois as exclusões em cascata dependem delas
+PERFIS_SQLITE = {
+    'safe-interactive': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -32000,
+                         'mmap_size': 256 * 1024 * 1024, 'temp_store': 'MEMORY'},
+    'durable': {'journal_mode': 'WAL', 'synchronous': 'FULL', 'cache_size': -32000,
+                'mmap_size': 256 * 1024 * 1024, 'temp_store': 'MEMORY'},
+    'bulk-load': {'journal_mode': 'WAL', 'synchronous': 'OFF', 'cache_size': -262144,
+                  'mmap_size': 1024 * 1024 * 1024, 'temp_store': 'MEMORY'},
+    'sqlite-default': {},
+}
+
+# Perfil usado quando nenhum é informado; pode ser escolhido pela variável de ambiente CATALOGO_PERFIL_SQLITE
+PERFIL_PADRAO = os.environ.get('CATALOGO_PERFIL_SQLITE', 'safe-interactive')
+
+# PRAGMAs que podem ser ajustados individualmente por cima de um perfil
+PRAGMAS_AJUSTAVEIS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store')
+
+# Função para montar os PRAGMAs de um perfil, com ajustes individuais opcionais (ex.: {'cache_size': -64000})
+def pragmas_perfil(perfil, ajustes=None):
+    if perfil not in PERFIS_SQLITE:
+        raise ValueError(f"Perfil de desempenho desconhecido: {perfil}")
+    pragmas = dict(PERFIS_SQLITE[perfil])
+    for nome, valor in (ajustes or {}).items():
+        if nome not in PRAGMAS_AJUSTAVEIS:
+            raise ValueError(f"PRAGMA não ajustável: {nome}")
+        if not re.fullmatch(r'-?\w+', str(valor)):
+            raise ValueError(f"Valor inválido para o PRAGMA {nome}: {valor}")
+        pragmas[nome] = valor
+    return pragmas
+
+# Função para aplicar os PRAGMAs em todas as conexões abertas pelo engine
+def aplicar_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def configurar_conexao(conexao_dbapi, _registro):
+        cursor = conexao_dbapi.cursor()
+        for nome, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nome} = {valor}")
+        cursor.execute("PRAGMA foreign_keys = ON")
+        cursor.close()
+
+# Função para que o SQLAlchemy controle o início das transações no SQLite
+# O driver sqlite3 abre transações por conta própria, o que impede o uso correto de SAVEPOINT;
+# com isolation_level=None o driver deixa de fazer isso e o BEGIN é emitido pelo próprio SQLAlchemy
+def controlar_transacoes(engine):
+    @event.listens_for(engine, 'connect')
+    def desativar_transacao_do_driver(conexao_dbapi, _registro):
+        conexao_dbapi.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def iniciar_transacao(conexao):
+        conexao.exec_driver_sql("BEGIN")
+
+# Verifica se as chaves estrangeiras gravadas no banco diferem das declaradas no modelo (ex.: sem ON DELETE)
+def _chaves_desatualizadas(conexao, tabela):
+    gravadas = {(linha[3], (linha[6] or 'NO ACTION').upper())
+                for linha in conexao.exec_driver_sql(f"PRAGMA foreign_key_list({tabela.name})")}
+    declaradas = {(chave.parent.name, (chave.ondelete or 'NO ACTION').upper()) for chave in tabela.foreign_keys}
+    return gravadas != declaradas
+
+# Função para atualizar as chaves estrangeiras de bancos criados antes das exclusões em cascata
+# O SQLite não altera restrições de tabelas existentes: cada tabela é recriada com o esquema atual e os dados
+# copiados. Registros órfãos deixados pelas versões anteriores (ex.: genero_id de um gênero excluído) são
+# desvinculados (SET NULL) ou removidos (CASCADE). Executada com as chaves estrangeiras desativadas, dentro da
+# transação do passo de migração. Devolve True se algo foi migrado.
+def migrar_chaves_estrangeiras(conexao):
+    tabelas = [tabela for tabela in Base.metadata.sorted_tables
+               if tabela.foreign_keys and _chaves_desatualizadas(conexao, tabela)]
+    if not tabelas:
+        return False
+
+    conexao.exec_driver_sql("PRAGMA legacy_alter_table = ON")  # Não reescrever as referências de outras tabelas
+    try:
+        for tabela in tabelas:
+            ddl = str(CreateTable(tabela).compile(dialect=conexao.dialect))
+            ddl = ddl.replace(f"CREATE TABLE {tabela.name} ", f"CREATE TABLE {tabela.name}_migracao ", 1)
+            colunas = ", ".join(coluna.name for coluna in tabela.c)
+            conexao.exec_driver_sql(ddl)
+            conexao.exec_driver_sql(f"INSERT INTO {tabela.name}_migracao ({colunas}) SELECT {colunas} FROM {tabela.name}")
+            conexao.exec_driver_sql(f"DROP TABLE {tabela.name}")
+            conexao.exec_driver_sql(f"ALTER TABLE {tabela.name}_migracao RENAME TO {tabela.name}")
+            for indice in tabela.indexes:
+                indice.create(conexao, checkfirst=True)
+
+        # Remover os órfãos; repete porque excluir uma música órfã deixa órfãs as suas associações
+        while violacoes := conexao.exec_driver_sql("PRAGMA foreign_key_check").all():
+            for nome_tabela, linha_id, _tabela_pai, chave_id in violacoes:
+                chave = next(linha for linha in conexao.exec_driver_sql(f"PRAGMA foreign_key_list({nome_tabela})")
+                             if linha[0] == chave_id)
+                if chave[6].upper() == 'SET NULL':
+                    conexao.exec_driver_sql(f"UPDATE {nome_tabela} SET {chave[3]} = NULL WHERE rowid = ?", (linha_id,))
+                else:
+                    conexao.exec_driver_sql(f"DELETE FROM {nome_tabela} WHERE rowid = ?", (linha_id,))
+    finally:
+        conexao.exec_driver_sql("PRAGMA legacy_alter_table = OFF")
+    return True
+
+# Função para criar as tabelas do catálogo e os índices que ainda não existem
+# (as tabelas derivadas são criadas pelos passos que as preenchem)
+def migrar_tabelas(conexao):
+    Base.metadata.create_all(conexao, tables=TABELAS_CATALOGO)
+    # O create_all só cria os índices de tabelas novas; tabelas já existentes recebem os índices aqui
+    for tabela in TABELAS_CATALOGO:
+        for indice in tabela.indexes:
+            indice.create(conexao, checkfirst=True)
+
+# Histórico das migrações aplicadas ao banco
+versoes_esquema = Table('versoes_esquema', Base.metadata,
+                        Column('versao', Integer, primary_key=True, autoincrement=False),
+                        Column('descricao', String, nullable=False),
+                        Column('aplicada_em', String, nullable=False)
+                        )
+
+# Migrações do esquema, em ordem: (versão, descrição, passo, chaves estrangeiras ativas durante o passo)
+# Cada passo roda em uma transação junto com a gravação da nova versão, então um passo interrompido é desfeito
+# por inteiro e executado de novo na próxima inicialização. Os passos também são idempotentes, pois bancos
+# criados antes do controle de versões (versão 0) já podem ter parte do esquema. Uma mudança no esquema
+# é feita acrescentando um passo ao final da lista, nunca alterando os anteriores.
+MIGRACOES = [
+    (1, "Tabelas e índices do catálogo", migrar_tabelas, True),
+    (2, "Chaves estrangeiras com exclusão em cascata", migrar_chaves_estrangeiras, False),
+    (3, "Estatísticas mantidas por gatilhos", setup_estatisticas, True),
+    (4, "Busca textual (FTS5)", setup_busca, True),
+    (5, "Agregados por álbum e artista", setup_agregados, True),
+    (6, "Registro de alterações para sincronização incremental", setup_alteracoes, True),
+]
+
+# Versão do esquema esperada por este programa, gravada no cabeçalho do banco (PRAGMA user_version)
+VERSAO_ESQUEMA = MIGRACOES[-1][0]
+
+def versao_esquema(conexao):
+    return conexao.exec_driver_sql("PRAGMA user_version").scalar()
+
+# Função para aplicar as migrações pendentes; devolve as versões aplicadas
+def migrar_esquema(engine):
+    aplicadas = []
+    with engine.connect() as conexao:
+        for versao, descricao, passo, chaves_estrangeiras in MIGRACOES:
+            # O PRAGMA foreign_keys não tem efeito dentro de uma transação
+            if not chaves_estrangeiras:
+                conexao.connection.cursor().execute("PRAGMA foreign_keys = OFF")
+            try:
+                with conexao.begin():
+                    if versao <= versao_esquema(conexao):
+                        continue
+                    versoes_esquema.create(conexao, checkfirst=True)
+                    passo(conexao)
+                    conexao.execute(insert(versoes_esquema).prefix_with('OR REPLACE').values(
+                        versao=versao, descricao=descricao,
+                        aplicada_em=datetime.now(timezone.utc).isoformat(timespec='seconds')))
+                    conexao.exec_driver_sql(f"PRAGMA user_version = {versao}")
+                    aplicadas.append(versao)
+            finally:
+                if not chaves_estrangeiras:
+                    conexao.connection.cursor().execute("PRAGMA foreign_keys = ON")
+    return aplicadas
 
 # Função para criar o banco de dados
-def setup_database():
-    engine = create_engine('sqlite:///musica_catalogo.db')
-    Base.metadata.create_all(engine)
+# Com o esquema na versão atual, a inicialização lê apenas o PRAGMA user_version, sem inspecionar as tabelas;
+# caso contrário as migrações pendentes são aplicadas.
+# Com instrumentacao (uma InstrumentacaoSQL), os comandos SQL de cada ação são medidos
+def setup_database(perfil=PERFIL_PADRAO, ajustes=None, url=URL_BANCO, instrumentacao=None):
+    if instrumentacao is None:
+        engine = create_engine(url)
+    else:
+        engine = create_engine(url, connect_args={'factory': ConexaoInstrumentada})
+        instrumentacao.instrumentar(engine)
+    aplicar_pragmas(engine, pragmas_perfil(perfil, ajustes))
+    controlar_transacoes(engine)
+    with engine.connect() as conexao:
+        versao = versao_esquema(conexao)
+    if versao > VERSAO_ESQUEMA:
+        raise RuntimeError(f"O banco está na versão {versao} do esquema, mais nova que a deste programa "
+                           f"({VERSAO_ESQUEMA}); atualize o programa.")
+    if versao < VERSAO_ESQUEMA:
+        migrar_esquema(engine)
     return engine
 
 # Função para iniciar sessão do banco de dados
@@ -62,278 +741,964 @@ def start_session(engine):
     Session = sessionmaker(bind=engine)
     return Session()
 
+# Fábricas das sessões do programa; cada ação do menu abre uma sessão e a fecha no final (sessao_acao), então
+# o mapa de identidade só guarda os objetos da ação em andamento.
+# - Sessao: ações que gravam. Com expire_on_commit=False os objetos não são expirados no commit: a sessão é
+#   descartada logo depois, e as leituras feitas após o commit (ex.: o ID do registro cadastrado) não
+#   precisam recarregar o objeto.
+# - SessaoLeitura: telas de consulta, sem autoflush e com a conexão em PRAGMA query_only.
+Sessao = sessionmaker(expire_on_commit=False)
+SessaoLeitura = sessionmaker(autoflush=False, expire_on_commit=False)
+
+# Função que abre a sessão de uma ação e a fecha no final (o que não foi confirmado pela ação é desfeito)
+# A sessão somente leitura fica presa a uma conexão em PRAGMA query_only, desativado antes de a conexão
+# voltar ao pool; os PRAGMAs vão pelo cursor do driver, fora das transações da sessão.
+@contextmanager
+def sessao_acao(engine, somente_leitura=False):
+    if not somente_leitura:
+        with Sessao(bind=engine) as session:
+            yield session
+        return
+    with engine.connect() as conexao:
+        cursor = conexao.connection.cursor()
+        cursor.execute("PRAGMA query_only = ON")
+        try:
+            with SessaoLeitura(bind=conexao) as session:
+                yield session
+        finally:
+            cursor.execute("PRAGMA query_only = OFF")
+
 # Função para mostrar tabela usando Tabulate
+# O tabulate só é importado na primeira tabela exibida, para não pesar na inicialização do programa
 def show_table(data, headers):
+    from tabulate import tabulate
     print(tabulate(data, headers, tablefmt="pretty"))
 
-# Função genérica para buscar registros
-def fetch_records(session, entity_class):
-    return session.query(entity_class).all()
+# Quantidade de linhas por página nas listagens
+PAGINA = 50
+
+# Fonte de páginas de uma consulta por paginação keyset sobre a coluna `chave`, que deve ser a primeira
+# coluna das linhas. carregar(operador, valor, limite) devolve até `limite` linhas em ordem crescente
+# de chave com "chave <operador> valor" (operador >, >= ou <; valor None = desde o início).
+def fonte_keyset(session, consulta, chave):
+    def carregar(operador, valor, limite):
+        pagina = consulta.order_by(None)
+        if valor is not None:
+            pagina = pagina.where(operador(chave, valor))
+        decrescente = operador is operator.lt
+        linhas = session.execute(pagina.order_by(chave.desc() if decrescente else chave).limit(limite)).all()
+        return linhas[::-1] if decrescente else linhas
+    return carregar
+
+# Fonte de páginas sobre linhas já em memória, ordenadas pela primeira coluna
+def fonte_memoria(linhas):
+    chaves = [linha[0] for linha in linhas]
+
+    def carregar(operador, valor, limite):
+        if valor is None:
+            return linhas[:limite]
+        if operador is operator.lt:
+            fim = bisect_left(chaves, valor)
+            return linhas[max(fim - limite, 0):fim]
+        inicio = bisect_left(chaves, valor) if operador is operator.ge else bisect_right(chaves, valor)
+        return linhas[inicio:inicio + limite]
+    return carregar
+
+# Função para exibir uma listagem página a página, com navegação para a próxima página, a anterior
+# ou a partir de um ID. Cada página é lida sob demanda, então a primeira aparece imediatamente e o uso
+# de memória não depende do tamanho da tabela. Listagens que cabem em uma página são exibidas direto.
+def paginate(carregar, headers, formatar=list, tamanho=PAGINA):
+    linhas = carregar(operator.gt, None, tamanho + 1)
+    if not linhas:
+        print("Nenhuma informação disponível.")
+        return
+    while True:
+        tem_proxima = len(linhas) > tamanho
+        pagina = linhas[:tamanho]
+        show_table([formatar(linha) for linha in pagina], headers)
+        primeira = not carregar(operator.lt, pagina[0][0], 1)
+        if primeira and not tem_proxima:
+            return
+
+        while True:
+            opcao = input("Enter: próxima página | a: anterior | i <ID>: ir para o ID | s: sair: ").strip().lower()
+            if opcao == '':
+                if not tem_proxima:
+                    return
+                linhas = carregar(operator.gt, pagina[-1][0], tamanho + 1)
+            elif opcao == 'a':
+                if primeira:
+                    print("Esta já é a primeira página.")
+                    continue
+                anteriores = carregar(operator.lt, pagina[0][0], tamanho)
+                if len(anteriores) < tamanho:
+                    linhas = carregar(operator.gt, None, tamanho + 1)
+                else:
+                    # A primeira linha da página atual indica que existe uma próxima página
+                    linhas = anteriores + pagina[:1]
+            elif opcao.startswith('i') and opcao[1:].strip().isdigit():
+                novas = carregar(operator.ge, int(opcao[1:]), tamanho + 1)
+                if not novas:
+                    print("Nenhum registro a partir deste ID.")
+                    continue
+                linhas = novas
+            elif opcao == 's':
+                return
+            else:
+                print("Opção inválida.")
+                continue
+            break
 
 # Função para verificar se o banco de dados está vazio
+# Uma única consulta com EXISTS, que para no primeiro registro encontrado em cada tabela
 def is_database_empty(session):
-    return not any([session.query(Artista).count(), session.query(Album).count(),
-                    session.query(Musica).count(), session.query(Genero).count()])
+    consulta = select(or_(*[select(entidade.id).exists() for entidade in (Artista, Album, Musica, Genero)]))
+    return not session.execute(consulta).scalar()
+
+# Função para ler as estatísticas do catálogo (contadores mantidos pelos gatilhos, sem varrer as tabelas)
+def get_estatisticas(session):
+    tabelas = dict(session.execute(select(estatisticas_tabelas.c.tabela, estatisticas_tabelas.c.total)).all())
+    generos = session.execute(
+        select(estatisticas_generos.c.genero_id, Genero.nome, estatisticas_generos.c.musicas)
+        .outerjoin(Genero, Genero.id == estatisticas_generos.c.genero_id)
+        .where(estatisticas_generos.c.musicas > 0)
+        .order_by(estatisticas_generos.c.musicas.desc())
+    ).all()
+    anos = session.execute(
+        select(estatisticas_anos.c.ano, estatisticas_anos.c.albuns, estatisticas_anos.c.musicas)
+        .where(or_(estatisticas_anos.c.albuns > 0, estatisticas_anos.c.musicas > 0))
+        .order_by(estatisticas_anos.c.ano)
+    ).all()
+    return {'tabelas': tabelas, 'generos': generos, 'anos': anos}
+
+def show_estatisticas(session):
+    estatisticas = get_estatisticas(session)
+    show_table([[rotulo, estatisticas['tabelas'].get(tabela, 0)]
+                for tabela, rotulo in (('artistas', "Artistas"), ('albuns', "Álbuns"),
+                                       ('musicas', "Músicas"), ('generos', "Gêneros"))], ["Tabela", "Registros"])
+    if estatisticas['generos']:
+        show_table([[genero_id or "-", nome or ("Sem Gênero" if not genero_id else "Gênero excluído"), musicas]
+                    for genero_id, nome, musicas in estatisticas['generos']], ["ID", "Gênero", "Músicas"])
+    if estatisticas['anos']:
+        show_table([[ano or "Sem ano", albuns, musicas] for ano, albuns, musicas in estatisticas['anos']],
+                   ["Ano", "Álbuns", "Músicas"])
+
+# Relatórios de agregados: título, tabela de totais e a entidade que dá nome à chave (quando houver)
+RELATORIOS_AGREGADOS = {
+    '1': ("Álbuns", agregados_albuns, Album),
+    '2': ("Artistas", agregados_artistas, Artista),
+    '3': ("Gêneros", estatisticas_generos, Genero),
+    '4': ("Anos", estatisticas_anos, None),
+}
+
+def duracao_media(duracao_total, musicas_com_duracao):
+    return duracao_total // musicas_com_duracao if musicas_com_duracao else None
+
+# Função para ler os agregados de uma entidade (uma linha pela chave primária, sem percorrer as músicas)
+def get_agregado(session, tabela, chave):
+    linha = session.execute(select(tabela).where(list(tabela.c)[0] == chave)).mappings().first()
+    if linha is None:
+        return None
+    return {**linha, 'duracao_media': duracao_media(linha['duracao_total'], linha['musicas_com_duracao'])}
+
+def show_agregados(session):
+    print("=" * 30)
+    for opcao, (titulo, _, _) in RELATORIOS_AGREGADOS.items():
+        print(f"{opcao}. {titulo}")
+    escolha = input("Escolha uma opção: ")
+    if escolha not in RELATORIOS_AGREGADOS:
+        print("Opção inválida.")
+        return
+    titulo, tabela, entidade = RELATORIOS_AGREGADOS[escolha]
+    chave = list(tabela.c)[0]
+
+    colunas = [chave]
+    headers = ["ID" if entidade is not None else "Ano"]
+    if entidade is not None:
+        colunas.append(entidade.nome)
+        headers.append("Nome")
+    if 'albuns' in tabela.c:
+        colunas.append(tabela.c.albuns)
+        headers.append("Álbuns")
+    colunas += [tabela.c.musicas, tabela.c.duracao_total, tabela.c.musicas_com_duracao]
+    headers += ["Músicas", "Duração total", "Duração média"]
+    consulta = select(*colunas)
+    if entidade is not None:
+        consulta = consulta.outerjoin(entidade, entidade.id == chave)
+
+    def formatar(linha):
+        *inicio, musicas, duracao_total, musicas_com_duracao = linha
+        if inicio[0] == 0:  # Chave 0: músicas sem gênero ou álbuns sem ano
+            inicio[:2] = ["-", "Sem Gênero"] if entidade is not None else ["Sem ano"]
+        media = duracao_media(duracao_total, musicas_com_duracao)
+        return [*inicio, musicas, formatar_duracao(duracao_total),
+                formatar_duracao(media) if media is not None else "-"]
+
+    valor = input(f"{headers[0]} (ou Enter para listar todos): ").strip()
+    if valor:
+        if not valor.isdigit():
+            print("Valor inválido.")
+            return
+        agregado = get_agregado(session, tabela, int(valor))
+        if agregado is None:
+            print(f"{titulo}: {valor} não encontrado.")
+            return
+        linha = [agregado[coluna.name] for coluna in tabela.c]
+        if entidade is not None:
+            registro = session.get(entidade, agregado[chave.name])
+            linha.insert(1, registro.nome if registro is not None else None)
+        show_table([formatar(linha)], headers)
+        return
+
+    print(f"\nAgregados: {titulo}")
+    paginate(fonte_keyset(session, consulta, chave), headers, formatar)
+
+# Função para verificar os agregados e, se houver divergências, oferecer a reconstrução
+def show_check_agregados(session):
+    divergencias = check_agregados(session.connection())
+    if not divergencias:
+        print("Os agregados estão consistentes.")
+        return
+    show_table([[tabela, len(chaves), ", ".join(map(str, chaves[:10])) + (" ..." if len(chaves) > 10 else "")]
+                for tabela, chaves in divergencias.items()], ["Tabela", "Divergências", "Chaves"])
+    if input("Deseja reconstruir os agregados? (s/n): ").lower() == 's':
+        try:
+            rebuild_estatisticas(session.connection())
+            rebuild_agregados(session.connection())
+            session.commit()
+            print("Agregados reconstruídos com sucesso!")
+        except SQLAlchemyError as erro:
+            session.rollback()
+            print(f"Erro ao reconstruir os agregados: {erro}")
+
+# Função para mostrar o resumo do registro de alterações e compactá-lo ou aplicar a retenção
+def show_alteracoes(session):
+    conexao = session.connection()
+    resumo = conexao.execute(
+        select(alteracoes.c.tabela, alteracoes.c.operacao, func.count(), func.min(alteracoes.c.seq),
+               func.max(alteracoes.c.seq))
+        .group_by(alteracoes.c.tabela, alteracoes.c.operacao)
+        .order_by(alteracoes.c.tabela, alteracoes.c.operacao)).all()
+    descartadas = conexao.execute(select(retencao_alteracoes.c.descartadas_ate)).scalar() or 0
+    show_table([list(linha) for linha in resumo], ["Tabela", "Operação", "Alterações", "Primeira", "Última"])
+    print(f"Cursor atual: {cursor_alteracoes(conexao)} | alterações descartadas até: {descartadas}")
+
+    if input("Deseja compactar o registro? (s/n): ").lower() == 's':
+        dias = input("Descartar também as alterações com mais de quantos dias? (Enter para nenhuma): ").strip()
+        try:
+            removidas = compactar_alteracoes(conexao)
+            if dias:
+                removidas += descartar_alteracoes(conexao, float(dias))
+            session.commit()
+            print(f"{removidas} alterações removidas do registro.")
+        except (ValueError, SQLAlchemyError) as erro:
+            session.rollback()
+            print(f"Erro ao compactar o registro: {erro}")
+
+# Função para formatar a duração (em segundos) no formato MM:SS ("-" para músicas sem duração)
+def formatar_duracao(duracao):
+    if duracao is None:
+        return "-"
+    minutos = duracao // 60  # Divisão inteira
+    segundos = duracao % 60  # Resto da divisão
+    return f"{minutos:02}:{segundos:02}"
+
+# Quantidade de linhas lidas do banco por vez ao percorrer o acervo
+ACERVO_LOTE = 1000
+
+# Consulta única que traz artistas, álbuns, músicas e gêneros já ordenados para agrupamento
+def consulta_acervo_artistas():
+    return (
+        select(Artista.id.label('artista_id'), Artista.nome.label('artista_nome'),
+               Album.id.label('album_id'), Album.nome.label('album_nome'),
+               Album.ano_lancamento, Album.coletanea,
+               Musica.id.label('musica_id'), Musica.faixa, Musica.nome.label('musica_nome'),
+               Musica.duracao, Genero.nome.label('genero_nome'))
+        .select_from(Artista)
+        .outerjoin(artista_album, artista_album.c.artista_id == Artista.id)
+        .outerjoin(Album, Album.id == artista_album.c.album_id)
+        .outerjoin(Musica, Musica.album_id == Album.id)
+        .outerjoin(Genero, Genero.id == Musica.genero_id)
+        .order_by(Artista.id, Album.id, Musica.id)
+    )
+
+# Consulta única das coletâneas, com os nomes dos artistas de cada música agregados pelo GROUP_CONCAT
+def consulta_acervo_coletaneas():
+    return (
+        select(Album.id.label('album_id'), Album.nome.label('album_nome'), Album.ano_lancamento,
+               Musica.id.label('musica_id'), Musica.faixa, Musica.nome.label('musica_nome'),
+               Musica.duracao, Genero.nome.label('genero_nome'),
+               func.group_concat(Artista.nome, ', ').label('artistas'))
+        .select_from(Album)
+        .outerjoin(Musica, Musica.album_id == Album.id)
+        .outerjoin(Genero, Genero.id == Musica.genero_id)
+        .outerjoin(artista_musica, artista_musica.c.musica_id == Musica.id)
+        .outerjoin(Artista, Artista.id == artista_musica.c.artista_id)
+        .where(Album.coletanea == True)  # noqa: E712
+        .group_by(Album.id, Musica.id)
+        .order_by(Album.id, Musica.id)
+    )
 
 # Função para mostrar o acervo completo, incluindo coletâneas
+# Todo o acervo é lido com um número fixo de consultas (uma para os artistas e outra para as
+# coletâneas), em lotes de ACERVO_LOTE linhas, e exibido agrupado por artista e álbum
 def show_acervo(session):
     if is_database_empty(session):
         print("Nenhuma informação disponível.")
-    else:
-        # Buscar todos os artistas
-        artistas = fetch_records(session, Artista)
-        if not artistas:
-            print("Nenhum artista disponível.")
-            return
+        return
 
-        # Iterar sobre os artistas e exibir os álbuns associados a cada um
-        for artista in artistas:
-            print(f"Artista: {artista.nome}")
+    linhas = session.execute(consulta_acervo_artistas(), execution_options={"yield_per": ACERVO_LOTE})
+    algum_artista = False
 
-            if not artista.albuns:
-                print("  Nenhum álbum associado a este artista.")
-                continue
+    # Iterar sobre os artistas e exibir os álbuns associados a cada um
+    for (_, artista_nome), linhas_artista in groupby(linhas, key=lambda linha: (linha.artista_id, linha.artista_nome)):
+        algum_artista = True
+        print(f"Artista: {artista_nome}")
 
-            for album in artista.albuns:
-                print(f"  Álbum: {album.nome} ({album.ano_lancamento}) - {'Coletânea' if album.coletanea else 'Solo'}")
+        for album_id, linhas_album in groupby(linhas_artista, key=lambda linha: linha.album_id):
+            if album_id is None:
+                print("  Nenhum álbum associado a este artista.")
+                break
 
-                if not album.musicas:
-                    print("    Nenhuma música associada a este álbum.")
-                    continue
+            linhas_album = iter(linhas_album)
+            linha = next(linhas_album)
+            print(f"  Álbum: {linha.album_nome} ({linha.ano_lancamento}) - {'Coletânea' if linha.coletanea else 'Solo'}")
 
-                # Mostrar todas as músicas associadas ao álbum
-                for musica in album.musicas:
-                    genero_nome = musica.genero.nome if musica.genero else "Sem Gênero"
-                    print(f"    Faixa {musica.faixa}: {musica.nome} - {musica.duracao} segundos (Gênero: {genero_nome})")
+            if linha.musica_id is None:
+                print("    Nenhuma música associada a este álbum.")
+                continue
 
-        # Exibir as coletâneas (álbuns que são marcados como coletâneas)
-        coletaneas = session.query(Album).filter_by(coletanea=True).all()
-        if coletaneas:
+            # Mostrar todas as músicas associadas ao álbum
+            for musica in [linha, *linhas_album]:
+                genero_nome = musica.genero_nome if musica.genero_nome is not None else "Sem Gênero"
+                duracao = f"{musica.duracao} segundos" if musica.duracao is not None else "duração não informada"
+                print(f"    Faixa {musica.faixa}: {musica.musica_nome} - {duracao} (Gênero: {genero_nome})")
+
+    if not algum_artista:
+        print("Nenhum artista disponível.")
+        return
+
+    # Exibir as coletâneas (álbuns que são marcados como coletâneas)
+    linhas = session.execute(consulta_acervo_coletaneas(), execution_options={"yield_per": ACERVO_LOTE})
+    for indice, (_, linhas_album) in enumerate(groupby(linhas, key=lambda linha: linha.album_id)):
+        linhas_album = iter(linhas_album)
+        linha = next(linhas_album)
+        if indice == 0:
             print("\nColetâneas:")
-            for album in coletaneas:
-                print(f"  Álbum: {album.nome} ({album.ano_lancamento}) - Coletânea")
-                if not album.musicas:
-                    print("    Nenhuma música associada a esta coletânea.")
-                    continue
-                for musica in album.musicas:
-                    genero_nome = musica.genero.nome if musica.genero else "Sem Gênero"
-                    artistas = ", ".join([artista.nome for artista in musica.artistas])
-                    # Converter a duração para minutos e segundos
-                    minutos = musica.duracao // 60  # Divisão inteira
-                    segundos = musica.duracao % 60  # Resto da divisão
-
-                    # Formatar o tempo em MM:SS
-                    duracao_formatada = f"{minutos:02}:{segundos:02}"
-                    print(f"    Faixa {musica.faixa}: {musica.nome} - {artistas} (Duração: {duracao_formatada}, Gênero: {genero_nome})")
+        print(f"  Álbum: {linha.album_nome} ({linha.ano_lancamento}) - Coletânea")
+
+        if linha.musica_id is None:
+            print("    Nenhuma música associada a esta coletânea.")
+            continue
+
+        for musica in [linha, *linhas_album]:
+            genero_nome = musica.genero_nome if musica.genero_nome is not None else "Sem Gênero"
+            artistas = musica.artistas or ""
+            duracao_formatada = formatar_duracao(musica.duracao)
+            print(f"    Faixa {musica.faixa}: {musica.musica_nome} - {artistas} (Duração: {duracao_formatada}, Gênero: {genero_nome})")
+
+# Quantidade máxima de registros mantidos em cada cache de consulta
+CACHE_LIMITE = 10000
+
+# Cache em memória das tabelas de consulta (id -> nome) usadas nos seletores de gênero e artista
+# A tabela completa, já ordenada, é reaproveitada pelas listagens enquanto os dados não mudarem. O cache é
+# invalidado pelos eventos da sessão (flush de alterações na entidade, commit e rollback) e, para
+# alterações feitas por outras conexões, pelo PRAGMA data_version. Guarda no máximo `limite` nomes,
+# descartando os usados há mais tempo; tabelas maiores que o limite são lidas direto do banco.
+class CacheConsulta:
+    def __init__(self, entidade, limite=CACHE_LIMITE):
+        self.entidade = entidade
+        self.limite = limite
+        self.nomes = OrderedDict()  # id -> nome, do uso mais antigo para o mais recente
+        self.completa = False  # True quando self.nomes contém a tabela inteira
+        self.ordenadas = None  # linhas (id, nome) da tabela inteira, em ordem de id
+        self.versao = None
+
+    def invalidar(self):
+        self.nomes.clear()
+        self.completa = False
+        self.ordenadas = None
+        self.versao = None
+
+    # O data_version só é comparável dentro da mesma conexão, por isso a versão inclui a conexão
+    def _versao_atual(self, session):
+        conexao = session.connection()
+        return id(conexao.connection.dbapi_connection), conexao.exec_driver_sql("PRAGMA data_version").scalar()
+
+    def _validar(self, session):
+        versao = self._versao_atual(session)
+        if versao != self.versao:
+            self.invalidar()
+            self.versao = versao
+
+    def nome(self, session, registro_id):
+        self._validar(session)
+        registro_id = int(registro_id)
+        if registro_id in self.nomes:
+            self.nomes.move_to_end(registro_id)
+            return self.nomes[registro_id]
+        if self.completa:
+            return None
+        nome = session.execute(select(self.entidade.nome).where(self.entidade.id == registro_id)).scalar()
+        if nome is not None:
+            self.nomes[registro_id] = nome
+            while len(self.nomes) > self.limite:
+                self.nomes.popitem(last=False)
+        return nome
+
+    # Devolve as linhas (id, nome) da tabela inteira, ou None se ela for maior que o limite do cache
+    def linhas(self, session):
+        self._validar(session)
+        if not self.completa:
+            linhas = session.execute(select(self.entidade.id, self.entidade.nome)
+                                     .order_by(self.entidade.id).limit(self.limite + 1)).all()
+            if len(linhas) > self.limite:
+                return None
+            self.nomes = OrderedDict(linhas)
+            self.completa = True
+            self.ordenadas = linhas
+        return self.ordenadas
+
+CACHE_GENEROS = CacheConsulta(Genero)
+CACHE_ARTISTAS = CacheConsulta(Artista)
+
+@event.listens_for(Session, 'after_flush')
+def invalidar_caches_alterados(session, _contexto):
+    alterados = {type(objeto) for objeto in (*session.new, *session.dirty, *session.deleted)}
+    for cache in (CACHE_GENEROS, CACHE_ARTISTAS):
+        if cache.entidade in alterados:
+            cache.invalidar()
+
+# Gravações feitas fora do ORM (importação, exclusões em massa) não passam pelo flush; o rollback de
+# savepoints (after_soft_rollback) também desfaz registros que podem já estar no cache
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_soft_rollback')
+def invalidar_caches(session, *_transacao):
+    # O RELEASE de um savepoint também dispara after_commit, mas não altera o que a sessão já enxerga
+    if session.in_nested_transaction() and not _transacao:
+        return
+    CACHE_GENEROS.invalidar()
+    CACHE_ARTISTAS.invalidar()
+
+# Função para mostrar uma tabela de consulta a partir do cache (ou paginada direto do banco, se ela não
+# couber no cache)
+def show_cached(session, cache):
+    linhas = cache.linhas(session)
+    if linhas is None:
+        carregar = fonte_keyset(session, select(cache.entidade.id, cache.entidade.nome), cache.entidade.id)
+    else:
+        carregar = fonte_memoria(linhas)
+    paginate(carregar, ["ID", "Nome"])
 
 # Funções para mostrar apenas os gêneros, artistas, álbuns e músicas
 def show_genero(session):
-    generos = fetch_records(session, Genero)
-    if not generos:
-        print("Nenhuma informação disponível.")
-    else:
-        show_table([[genero.id, genero.nome] for genero in generos], ["ID", "Nome"])
+    show_cached(session, CACHE_GENEROS)
 
 def show_artista(session):
-    artistas = fetch_records(session, Artista)
-    if not artistas:
-        print("Nenhuma informação disponível.")
-    else:
-        show_table([[artista.id, artista.nome] for artista in artistas], ["ID", "Nome"])
+    show_cached(session, CACHE_ARTISTAS)
 
 def show_album(session):
-    albuns = fetch_records(session, Album)
-    if not albuns:
-        print("Nenhuma informação disponível.")
-    else:
-        show_table([[album.id, album.nome, album.ano_lancamento] for album in albuns], ["ID", "Nome", "Ano"])
+    consulta = select(Album.id, Album.nome, Album.ano_lancamento)
+    paginate(fonte_keyset(session, consulta, Album.id), ["ID", "Nome", "Ano"])
+
+# Consulta única da listagem de músicas: junta músicas, álbuns e gêneros e agrega os artistas
+# com GROUP_CONCAT, devolvendo tuplas simples em vez de objetos do ORM
+def consulta_listagem_musicas():
+    return (
+        select(Musica.id, Musica.nome, func.group_concat(Artista.nome, ', '),
+               Album.id, Album.nome, Album.ano_lancamento, Musica.duracao, Genero.nome)
+        .select_from(Musica)
+        .outerjoin(Album, Album.id == Musica.album_id)
+        .outerjoin(Genero, Genero.id == Musica.genero_id)
+        .outerjoin(artista_musica, artista_musica.c.musica_id == Musica.id)
+        .outerjoin(Artista, Artista.id == artista_musica.c.artista_id)
+        .group_by(Musica.id)
+        .order_by(Musica.id)
+    )
+
+# Função para formatar uma linha da listagem de músicas
+def formatar_linha_musica(linha):
+    musica_id, nome, artistas, album_id, album_nome, ano, duracao, genero = linha
+    if album_id is not None:  # Verificar se o álbum ainda existe
+        genero = genero if genero is not None else "Sem Gênero"
+        return [musica_id, nome, artistas or "", album_nome, ano, formatar_duracao(duracao), genero]
+    # Tratar o caso em que o álbum foi excluído
+    return [musica_id, nome, "Álbum excluído", "Álbum excluído", "N/A", formatar_duracao(duracao), "N/A"]
 
 def show_musica(session):
-    musicas = session.query(Musica).all()
-
-    if not musicas:
-        print("Nenhuma informação disponível.")
+    headers = ["ID", "Música", "Artista", "Álbum", "Ano", "Duração", "Gênero"]
+    paginate(fonte_keyset(session, consulta_listagem_musicas(), Musica.id), headers, formatar_linha_musica)
+
+# Quantidade máxima de resultados exibidos por busca
+BUSCA_LIMITE = 20
+
+# Função para converter o texto digitado em uma consulta FTS5: cada palavra vira um prefixo ("palavra"*)
+def termo_busca(texto):
+    palavras = [palavra.replace('"', '') for palavra in texto.split()]
+    return " ".join(f'"{palavra}"*' for palavra in palavras if palavra)
+
+# Consultas de busca por entidade, ordenadas pela relevância (bm25) calculada pelo FTS5
+CONSULTAS_BUSCA = {
+    Artista: """SELECT artistas.id, artistas.nome
+        FROM busca_artistas JOIN artistas ON artistas.id = busca_artistas.rowid
+        WHERE busca_artistas MATCH :termo ORDER BY busca_artistas.rank LIMIT :limite""",
+    Album: """SELECT albuns.id, albuns.nome, albuns.ano_lancamento
+        FROM busca_albuns JOIN albuns ON albuns.id = busca_albuns.rowid
+        WHERE busca_albuns MATCH :termo ORDER BY busca_albuns.rank LIMIT :limite""",
+    Musica: """SELECT musicas.id, musicas.nome, albuns.nome
+        FROM busca_musicas JOIN musicas ON musicas.id = busca_musicas.rowid
+        LEFT JOIN albuns ON albuns.id = musicas.album_id
+        WHERE busca_musicas MATCH :termo ORDER BY busca_musicas.rank LIMIT :limite""",
+}
+
+COLUNAS_BUSCA = {
+    Artista: ["ID", "Artista"],
+    Album: ["ID", "Álbum", "Ano"],
+    Musica: ["ID", "Música", "Álbum"],
+    Genero: ["ID", "Gênero"],
+}
+
+# Função para buscar registros de uma entidade pelo nome, com correspondência por prefixo
+def search_entidade(session, entidade, texto, limite=BUSCA_LIMITE):
+    termo = termo_busca(texto)
+    if not termo:
+        return []
+    return session.execute(text(CONSULTAS_BUSCA[entidade]), {'termo': termo, 'limite': limite}).all()
+
+def show_busca(session, entidade, texto):
+    resultados = search_entidade(session, entidade, texto)
+    if resultados:
+        show_table([list(resultado) for resultado in resultados], COLUNAS_BUSCA[entidade])
     else:
-        data = []
-        for musica in musicas:
-            album = session.get(Album, musica.album_id)
-            if album:  # Verificar se o álbum ainda existe
-                artistas = ", ".join([artista.nome for artista in musica.artistas])
-                genero = session.get(Genero, musica.genero_id).nome if musica.genero else "Sem Gênero"
-
-                # Converter a duração para minutos e segundos
-                minutos = musica.duracao // 60  # Divisão inteira
-                segundos = musica.duracao % 60  # Resto da divisão
-
-                # Formatar o tempo em MM:SS
-                duracao_formatada = f"{minutos:02}:{segundos:02}"
-
-                # Adicionar os dados na lista, incluindo o ID da música
-                data.append([musica.id, musica.nome, artistas, album.nome, album.ano_lancamento, duracao_formatada, genero])
-            else:
-                # Tratar o caso em que o álbum foi excluído
-                data.append([musica.id, musica.nome, "Álbum excluído", "Álbum excluído", "N/A", musica.duracao, "N/A"])
-
-        # Mostrar a tabela com as informações
-        headers = ["ID", "Música", "Artista", "Álbum", "Ano", "Duração", "Gênero"]
-        print(tabulate(data, headers=headers, tablefmt="pretty"))
+        print("Nenhum resultado encontrado.")
+    return resultados
+
+# Função para buscar músicas, álbuns e artistas pelo nome a partir do menu principal
+def search_acervo(session):
+    texto = input("Digite o nome (ou o início do nome) a buscar: ")
+    if not termo_busca(texto):
+        print("Nenhum termo de busca informado.")
+        return
+    for entidade, titulo in ((Artista, "Artistas"), (Album, "Álbuns"), (Musica, "Músicas")):
+        print(f"\n{titulo}:")
+        show_busca(session, entidade, texto)
+
+# Quantidade de sugestões mostradas pelo seletor de IDs e de possíveis duplicatas mostradas nos cadastros
+SELETOR_LIMITE = 10
+DUPLICATAS_LIMITE = 5
+
+# Maior caractere Unicode: nenhum nome que comece com o prefixo passa de prefixo + este caractere
+_FIM_PREFIXO = chr(0x10FFFF)
+
+# Colunas do seletor de cada entidade (as mesmas da busca textual)
+def consulta_seletor(entidade):
+    if entidade is Musica:
+        return select(Musica.id, Musica.nome, Album.nome).outerjoin(Album, Album.id == Musica.album_id)
+    if entidade is Album:
+        return select(Album.id, Album.nome, Album.ano_lancamento)
+    return select(entidade.id, entidade.nome)
+
+# Função para buscar os registros cujo nome começa com o texto, sem diferenciar maiúsculas/minúsculas.
+# A condição é um intervalo sobre o índice NOCASE do nome, então cada busca custa uma descida no índice
+# mais a leitura de no máximo `limite` entradas, qualquer que seja o tamanho da tabela.
+def search_prefixo(session, entidade, prefixo, limite=SELETOR_LIMITE):
+    prefixo = prefixo.strip()
+    if not prefixo:
+        return []
+    nome = entidade.nome.collate('NOCASE')
+    consulta = (consulta_seletor(entidade)
+                .where(nome >= prefixo, nome < prefixo + _FIM_PREFIXO)
+                .order_by(nome, entidade.id)
+                .limit(limite))
+    return session.execute(consulta).all()
+
+# Listagens completas, exibidas no seletor quando o usuário digita "?"
+LISTAGENS = {Genero: show_genero, Artista: show_artista, Album: show_album, Musica: show_musica}
+
+# Função para pedir um ID aceitando também o início do nome: enquanto o usuário digitar texto, as primeiras
+# correspondências por prefixo (ou, se não houver, da busca textual) são exibidas e o ID é pedido novamente.
+# "?" mostra a listagem completa, página a página.
+def input_id(session, entidade, mensagem):
+    while True:
+        valor = input(mensagem).strip()
+        if not valor or valor.isdigit():
+            return valor
+        if valor == '?':
+            LISTAGENS[entidade](session)
+            continue
+        resultados = search_prefixo(session, entidade, valor)
+        if not resultados and entidade in CONSULTAS_BUSCA:
+            resultados = search_entidade(session, entidade, valor, SELETOR_LIMITE)
+        if resultados:
+            show_table([list(resultado) for resultado in resultados], COLUNAS_BUSCA[entidade])
+        else:
+            print("Nenhum registro encontrado. Digite '?' para ver a lista completa.")
+
+# Função para listar os registros com nome igual ou parecido (mesmo início, sem diferenciar maiúsculas/
+# minúsculas, ou com as mesmas palavras, pela busca textual) antes de um novo cadastro
+def search_duplicatas(session, entidade, nome, limite=DUPLICATAS_LIMITE):
+    resultados = search_prefixo(session, entidade, nome, limite)
+    if len(resultados) < limite and entidade in CONSULTAS_BUSCA:
+        encontrados = {resultado[0] for resultado in resultados}
+        resultados += [resultado for resultado in search_entidade(session, entidade, nome, limite)
+                       if resultado[0] not in encontrados][:limite - len(resultados)]
+    return resultados
+
+# Função para confirmar o cadastro quando já existem registros parecidos; devolve True se pode cadastrar
+def confirm_novo(session, entidade, nome):
+    duplicatas = search_duplicatas(session, entidade, nome)
+    if not duplicatas:
+        return True
+    print("Já existem registros parecidos:")
+    show_table([list(duplicata) for duplicata in duplicatas], COLUNAS_BUSCA[entidade])
+    return input("Cadastrar mesmo assim? (s/n): ").lower() == 's'
+
+# Camada de serviços
+# Funções sem interação com o usuário (sem input() ou print()) para criar, atualizar, excluir e consultar
+# as quatro entidades. Elas não fazem commit: quem chama decide o tamanho da transação (um cadastro
+# interativo ou milhares de operações de um lote). Registros inexistentes geram LookupError.
+def _obter(session: Session, entidade: type, registro_id: int):
+    registro = session.get(entidade, registro_id)
+    if registro is None:
+        raise LookupError(f"{entidade.__name__} {registro_id} não encontrado(a)")
+    return registro
+
+def _obter_artistas(session: Session, artista_ids: Sequence[int]) -> list[Artista]:
+    return [_obter(session, Artista, artista_id) for artista_id in artista_ids]
+
+def criar_genero(session: Session, nome: str) -> Genero:
+    genero = Genero(nome=nome)
+    session.add(genero)
+    session.flush()
+    return genero
+
+def criar_artista(session: Session, nome: str) -> Artista:
+    artista = Artista(nome=nome)
+    session.add(artista)
+    session.flush()
+    return artista
+
+def criar_album(session: Session, nome: str, ano_lancamento: int | None = None, coletanea: bool = False,
+                artista_ids: Sequence[int] = ()) -> Album:
+    album = Album(nome=nome, ano_lancamento=ano_lancamento, coletanea=coletanea,
+                  artistas=_obter_artistas(session, artista_ids))
+    session.add(album)
+    session.flush()
+    return album
+
+# Sem artistas informados, a música de um álbum solo herda o artista do álbum (como no cadastro interativo)
+def criar_musica(session: Session, album_id: int, nome: str, faixa: int | None = None, duracao: int | None = None,
+                 genero_id: int | None = None, artista_ids: Sequence[int] = ()) -> Musica:
+    album = _obter(session, Album, album_id)
+    artistas = _obter_artistas(session, artista_ids) if artista_ids else ([] if album.coletanea else album.artistas[:1])
+    musica = Musica(nome=nome, faixa=faixa, duracao=duracao, album=album, genero_id=genero_id, artistas=artistas)
+    session.add(musica)
+    session.flush()
+    return musica
+
+def atualizar_genero(session: Session, genero_id: int, nome: str | None = None) -> Genero:
+    genero = _obter(session, Genero, genero_id)
+    if nome:
+        genero.nome = nome
+    return genero
+
+def atualizar_artista(session: Session, artista_id: int, nome: str | None = None) -> Artista:
+    artista = _obter(session, Artista, artista_id)
+    if nome:
+        artista.nome = nome
+    return artista
+
+# Os artistas informados são associados ao álbum, sem remover as associações existentes
+def atualizar_album(session: Session, album_id: int, nome: str | None = None, ano_lancamento: int | None = None,
+                    coletanea: bool | None = None, artista_ids: Sequence[int] = ()) -> Album:
+    album = _obter(session, Album, album_id)
+    if nome:
+        album.nome = nome
+    if ano_lancamento is not None:
+        album.ano_lancamento = ano_lancamento
+    if coletanea is not None:
+        album.coletanea = coletanea
+    for artista in _obter_artistas(session, artista_ids):
+        if artista not in album.artistas:
+            album.artistas.append(artista)
+    return album
+
+def atualizar_musica(session: Session, musica_id: int, nome: str | None = None, faixa: int | None = None,
+                     duracao: int | None = None, genero_id: int | None = None, album_id: int | None = None,
+                     artista_ids: Sequence[int] = ()) -> Musica:
+    musica = _obter(session, Musica, musica_id)
+    if nome:
+        musica.nome = nome
+    if faixa is not None:
+        musica.faixa = faixa
+    if duracao is not None:
+        musica.duracao = duracao
+    if genero_id is not None:
+        musica.genero_id = genero_id
+    if album_id is not None:
+        musica.album = _obter(session, Album, album_id)
+    for artista in _obter_artistas(session, artista_ids):
+        if artista not in musica.artistas:
+            musica.artistas.append(artista)
+    return musica
+
+def _excluir(session: Session, entidade: type, registro_id: int) -> None:
+    session.delete(_obter(session, entidade, registro_id))
+    session.flush()
+
+def excluir_genero(session: Session, genero_id: int) -> None:
+    _excluir(session, Genero, genero_id)
+
+def excluir_artista(session: Session, artista_id: int) -> None:
+    _excluir(session, Artista, artista_id)
+
+def excluir_album(session: Session, album_id: int) -> None:
+    _excluir(session, Album, album_id)
+
+def excluir_musica(session: Session, musica_id: int) -> None:
+    _excluir(session, Musica, musica_id)
+
+# Exclusões em massa: um único DELETE com filtros, sem carregar os registros; músicas e associações são
+# removidas pelas cascatas do banco. Os objetos já carregados na sessão não são sincronizados.
+def filtros_albuns(antes_de: int | None = None, a_partir_de: int | None = None, coletanea: bool | None = None,
+                   artista_id: int | None = None) -> list:
+    filtros = []
+    if antes_de is not None:
+        filtros.append(Album.ano_lancamento < antes_de)
+    if a_partir_de is not None:
+        filtros.append(Album.ano_lancamento >= a_partir_de)
+    if coletanea is not None:
+        filtros.append(Album.coletanea == coletanea)
+    if artista_id is not None:
+        filtros.append(Album.id.in_(select(artista_album.c.album_id).where(artista_album.c.artista_id == artista_id)))
+    return filtros
+
+# genero_id 0 seleciona as músicas sem gênero; antes_de e a_partir_de se referem ao ano do álbum
+def filtros_musicas(genero_id: int | None = None, album_id: int | None = None, artista_id: int | None = None,
+                    antes_de: int | None = None, a_partir_de: int | None = None) -> list:
+    filtros = []
+    if genero_id is not None:
+        filtros.append(Musica.genero_id.is_(None) if genero_id == 0 else Musica.genero_id == genero_id)
+    if album_id is not None:
+        filtros.append(Musica.album_id == album_id)
+    if artista_id is not None:
+        filtros.append(Musica.id.in_(select(artista_musica.c.musica_id).where(artista_musica.c.artista_id == artista_id)))
+    if antes_de is not None or a_partir_de is not None:
+        filtros.append(Musica.album_id.in_(select(Album.id).where(*filtros_albuns(antes_de, a_partir_de))))
+    return filtros
+
+def contar_em_massa(session: Session, entidade: type, filtros: Sequence) -> int:
+    return session.execute(select(func.count()).select_from(entidade).where(*filtros)).scalar()
+
+def _excluir_em_massa(session: Session, entidade: type, filtros: Sequence) -> int:
+    if not filtros:
+        raise ValueError("Informe ao menos um filtro para a exclusão em massa")
+    resultado = session.execute(delete(entidade).where(*filtros), execution_options={'synchronize_session': False})
+    return resultado.rowcount
+
+def excluir_albuns_em_massa(session: Session, antes_de: int | None = None, a_partir_de: int | None = None,
+                            coletanea: bool | None = None, artista_id: int | None = None) -> int:
+    return _excluir_em_massa(session, Album, filtros_albuns(antes_de, a_partir_de, coletanea, artista_id))
+
+def excluir_musicas_em_massa(session: Session, genero_id: int | None = None, album_id: int | None = None,
+                             artista_id: int | None = None, antes_de: int | None = None,
+                             a_partir_de: int | None = None) -> int:
+    return _excluir_em_massa(session, Musica, filtros_musicas(genero_id, album_id, artista_id, antes_de, a_partir_de))
+
+def consultar_genero(session: Session, genero_id: int) -> dict:
+    genero = _obter(session, Genero, genero_id)
+    return {'id': genero.id, 'nome': genero.nome}
+
+def consultar_artista(session: Session, artista_id: int) -> dict:
+    artista = _obter(session, Artista, artista_id)
+    return {'id': artista.id, 'nome': artista.nome}
+
+def consultar_album(session: Session, album_id: int) -> dict:
+    album = _obter(session, Album, album_id)
+    return {'id': album.id, 'nome': album.nome, 'ano_lancamento': album.ano_lancamento,
+            'coletanea': bool(album.coletanea), 'artista_ids': [artista.id for artista in album.artistas]}
+
+def consultar_musica(session: Session, musica_id: int) -> dict:
+    musica = _obter(session, Musica, musica_id)
+    return {'id': musica.id, 'nome': musica.nome, 'faixa': musica.faixa, 'duracao': musica.duracao,
+            'album_id': musica.album_id, 'genero_id': musica.genero_id,
+            'artista_ids': [artista.id for artista in musica.artistas]}
 
 # Funções CRUD para Gênero, Artista, Álbum e Música
-def create_genero(session):
+# Os cadastros de gênero e artista podem ser chamados de dentro de outro cadastro (álbum ou música);
+# nesse caso usam commit=False e só enviam o registro ao banco (flush), deixando o commit para o final
+# da operação principal
+# Antes de gravar, os registros com nome parecido são mostrados e o cadastro precisa ser confirmado
+def create_genero(session, commit=True):
     while True:
         nome = input("Nome do Gênero: ")
-        genero = Genero(nome=nome)
-        session.add(genero)
-        session.commit()
-        print(f"Gênero '{nome}' cadastrado com sucesso!")
+        if confirm_novo(session, Genero, nome):
+            genero = criar_genero(session, nome)
+            if commit:
+                session.commit()
+            print(f"Gênero '{nome}' cadastrado com sucesso (ID {genero.id})!")
+        else:
+            print("Gênero não cadastrado.")
         if input("Cadastrar outro gênero? (s/n): ").lower() != 's':
             break
 
-def create_artista(session):
+def create_artista(session, commit=True):
     while True:
         nome = input("Nome do Artista: ")
-        artista = Artista(nome=nome)
-        session.add(artista)
-        session.commit()
-        print(f"Artista '{nome}' cadastrado com sucesso!")
+        if confirm_novo(session, Artista, nome):
+            artista = criar_artista(session, nome)
+            if commit:
+                session.commit()
+            print(f"Artista '{nome}' cadastrado com sucesso (ID {artista.id})!")
+        else:
+            print("Artista não cadastrado.")
         if input("Cadastrar outro artista? (s/n): ").lower() != 's':
             break
 
 # Função para cadastrar álbum e associar músicas a artistas
+# Todo o cadastro é uma única transação, confirmada com um commit ao final: se o cadastro for
+# interrompido, nada do álbum fica gravado. Cada música é gravada dentro de um savepoint, então
+# uma faixa com erro é descartada sozinha sem desfazer o restante do álbum.
 def create_album(session):
-    # Solicitar informações do álbum
-    nome_album = input("Nome do Álbum: ")
-    ano_album = input("Ano do Álbum: ")
-    coletanea = input("O álbum é uma coletânea? (s/n): ").lower() == 's'
-
-    # Criação do álbum no banco de dados
-    album = Album(nome=nome_album, ano_lancamento=ano_album, coletanea=coletanea)
-    session.add(album)
-    session.commit()
-
-    if not coletanea:
-        # Caso o álbum seja de um único artista, associar o artista uma única vez
-        show_artista(session)  # Mostrar lista de artistas existentes
-        artista_id = input("Digite o ID do artista para associar ao álbum ou pressione Enter para cadastrar novo: ")
-
-        if not artista_id:
-            # Se o artista não existe, criar um novo
-            create_artista(session)
-            show_artista(session)  # Mostrar lista atualizada de artistas
-            artista_id = input("Digite o ID do artista: ")
-
-        # Associar o artista ao álbum
-        artista = session.get(Artista, artista_id)
-        if artista:
-            album.artistas.append(artista)
-            session.commit()  # Salvar a associação entre o artista e o álbum no banco de dados
-            print(f"Álbum '{nome_album}' associado ao artista '{artista.nome}' com sucesso!")
-
-    # Cadastro das músicas para o álbum
-    while True:
-        nome_musica = input("Nome da música: ")
-        faixa = int(input("Número da faixa: "))
-        duracao = int(input("Duração da música (em segundos): "))
-
-        # Mostrar gêneros existentes
-        show_genero(session)
-        genero_id = input("Digite o ID do gênero ou pressione Enter para cadastrar novo: ")
-        if not genero_id:
-            create_genero(session)
-            show_genero(session)
-            genero_id = input("Digite o ID do gênero: ")
-
-        # Para coletâneas, o artista deve ser solicitado a cada nova música
-        if coletanea:
-            show_artista(session)  # Mostrar lista de artistas existentes
-            artista_id = input("Digite o ID do artista para associar à música ou pressione Enter para cadastrar novo: ")
+    try:
+        # Solicitar informações do álbum
+        nome_album = input("Nome do Álbum: ")
+        ano_album = input("Ano do Álbum (ou Enter se não souber): ").strip()
+        ano_album = int(ano_album) if ano_album else None
+        coletanea = input("O álbum é uma coletânea? (s/n): ").lower() == 's'
+
+        # Criação do álbum na transação
+        album = Album(nome=nome_album, ano_lancamento=ano_album, coletanea=coletanea)
+        session.add(album)
+
+        artista = None
+        if not coletanea:
+            # Caso o álbum seja de um único artista, associar o artista uma única vez
+            artista_id = input_id(session, Artista, "Digite o ID ou o início do nome do artista para associar ao álbum "
+                                                    "ou pressione Enter para cadastrar novo: ")
 
             if not artista_id:
-                create_artista(session)
-                show_artista(session)  # Mostrar lista atualizada de artistas
-                artista_id = input("Digite o ID do artista: ")
+                # Se o artista não existe, criar um novo
+                create_artista(session, commit=False)
+                artista_id = input_id(session, Artista, "Digite o ID ou o início do nome do artista: ")
 
+            # Associar o artista ao álbum
             artista = session.get(Artista, artista_id)
-        else:
-            # Se não for coletânea, usa o mesmo artista já associado ao álbum
-            artista = album.artistas[0]  # O único artista do álbum
-
-        # Criar a música e associar ao álbum e ao artista
-        musica = Musica(nome=nome_musica, faixa=faixa, duracao=duracao, album_id=album.id, genero_id=genero_id)
-        session.add(musica)
-        session.commit()
-
-        # Verificar se o artista já está associado à música, associando se necessário
-        if artista not in musica.artistas:
-            musica.artistas.append(artista)
-            session.commit()
+            if artista:
+                album.artistas.append(artista)
+                print(f"Álbum '{nome_album}' associado ao artista '{artista.nome}' com sucesso!")
+
+        # Cadastro das músicas para o álbum
+        while True:
+            try:
+                with session.begin_nested():
+                    nome_musica = input("Nome da música: ")
+                    faixa = int(input("Número da faixa: "))
+                    duracao = int(input("Duração da música (em segundos): "))
+
+                    genero_id = input_id(session, Genero, "Digite o ID ou o início do nome do gênero "
+                                                          "ou pressione Enter para cadastrar novo: ")
+                    if not genero_id:
+                        create_genero(session, commit=False)
+                        genero_id = input_id(session, Genero, "Digite o ID ou o início do nome do gênero: ")
+                    if CACHE_GENEROS.nome(session, genero_id) is None:
+                        raise ValueError("gênero não encontrado")
+
+                    # Para coletâneas, o artista deve ser solicitado a cada nova música
+                    if coletanea:
+                        artista_id = input_id(session, Artista, "Digite o ID ou o início do nome do artista para "
+                                                                "associar à música ou pressione Enter para cadastrar novo: ")
+
+                        if not artista_id:
+                            create_artista(session, commit=False)
+                            artista_id = input_id(session, Artista, "Digite o ID ou o início do nome do artista: ")
+
+                        artista = session.get(Artista, artista_id)
+
+                    # Criar a música e associar ao álbum e ao artista
+                    criar_musica(session, album.id, nome_musica, faixa, duracao, genero_id,
+                                 [artista.id] if artista else ())
 
-        print(f"Música '{nome_musica}' cadastrada no álbum '{album.nome}' e associada ao artista '{artista.nome}'.")
+                if artista:
+                    print(f"Música '{nome_musica}' cadastrada no álbum '{album.nome}' e associada ao artista '{artista.nome}'.")
+                else:
+                    print(f"Música '{nome_musica}' cadastrada no álbum '{album.nome}' sem artista associado.")
+            except (ValueError, IntegrityError) as erro:
+                # O savepoint já foi desfeito; apenas esta faixa é descartada
+                print(f"Música não cadastrada: {getattr(erro, 'orig', erro)}")
 
-        # Verificar se deseja adicionar mais músicas
-        if input("Cadastrar outra música? (s/n): ").lower() != 's':
-            break
+            # Verificar se deseja adicionar mais músicas
+            if input("Cadastrar outra música? (s/n): ").lower() != 's':
+                break
 
+        session.commit()
+        print(f"Álbum '{album.nome}' gravado com sucesso!")
+    except Exception as erro:
+        session.rollback()
+        print(f"Cadastro do álbum cancelado ({erro}). Nenhuma informação foi gravada.")
+    except BaseException:
+        session.rollback()
+        raise
+
+# Função para cadastrar uma música em um álbum existente, gravada com um único commit
 def create_musica(session):
-    albuns = session.query(Album).all()
-
-    if albuns:
-        # Mostrar álbuns existentes
-        print("Álbuns existentes:")
-        show_table([[album.id, album.nome] for album in albuns], ["ID", "Nome"])
-
+    if session.execute(select(Album.id).exists().select()).scalar():
         # Pedir o ID do álbum
-        album_id = input("Digite o ID do álbum para cadastrar a música: ")
+        album_id = input_id(session, Album, "Digite o ID ou o início do nome do álbum para cadastrar a música "
+                                            "('?' lista os álbuns): ")
         album = session.get(Album, album_id)
 
         if album:
-            # Continuar com o cadastro da música
-            nome_musica = input("Nome da música: ")
-            duracao = int(input("Duração da música (em segundos): "))
-            faixa = int(input("Número da faixa: "))
-            ano_lancamento = int(input("Ano de lançamento da música: "))
-
-            # Mostrar gêneros existentes
-            show_genero(session)
-            genero_id = input("Digite o ID do gênero ou pressione Enter para cadastrar novo: ")
-            if not genero_id:
-                create_genero(session)
-                show_genero(session)
-                genero_id = input("Digite o ID do gênero: ")
-
-            # Criar a música e associar ao álbum
-            musica = Musica(nome=nome_musica, faixa=faixa, duracao=duracao, album_id=album.id, genero_id=genero_id)
-            session.add(musica)
-            session.commit()
-
-            # Verificar se o álbum é uma coletânea (múltiplos artistas)
-            if album.coletanea:
-                # Perguntar o artista para cada música em coletâneas
-                show_artista(session)  # Mostrar lista de artistas existentes
-                artista_id = input("Digite o ID do artista para associar à música ou pressione Enter para cadastrar novo: ")
-
-                if not artista_id:
-                    create_artista(session)
-                    show_artista(session)
-                    artista_id = input("Digite o ID do artista: ")
+            try:
+                # Continuar com o cadastro da música
+                nome_musica = input("Nome da música: ")
+                duracao = int(input("Duração da música (em segundos): "))
+                faixa = int(input("Número da faixa: "))
+                ano_lancamento = int(input("Ano de lançamento da música: "))
+
+                genero_id = input_id(session, Genero, "Digite o ID ou o início do nome do gênero "
+                                                      "ou pressione Enter para cadastrar novo: ")
+                if not genero_id:
+                    create_genero(session, commit=False)
+                    genero_id = input_id(session, Genero, "Digite o ID ou o início do nome do gênero: ")
+                if CACHE_GENEROS.nome(session, genero_id) is None:
+                    raise ValueError("gênero não encontrado")
+
+                # Criar a música e associar ao álbum (em álbuns solo, já associada ao artista do álbum)
+                musica = criar_musica(session, album.id, nome_musica, faixa, duracao, genero_id)
+
+                # Verificar se o álbum é uma coletânea (múltiplos artistas)
+                if album.coletanea:
+                    # Perguntar o artista para cada música em coletâneas
+                    artista_id = input_id(session, Artista, "Digite o ID ou o início do nome do artista para "
+                                                            "associar à música ou pressione Enter para cadastrar novo: ")
+
+                    if not artista_id:
+                        create_artista(session, commit=False)
+                        artista_id = input_id(session, Artista, "Digite o ID ou o início do nome do artista: ")
 
-                artista = session.get(Artista, artista_id)
-                if artista:
-                    # Associar o artista à música
-                    musica.artistas.append(artista)
-                    session.commit()
-                    print(f"Música '{nome_musica}' associada ao artista '{artista.nome}' na coletânea '{album.nome}'!")
-                else:
-                    print("Artista não encontrado.")
-            else:
-                # Para álbuns de um único artista, associar o artista ao álbum
-                if len(album.artistas) > 0:
-                    artista = album.artistas[0]  # Pegando o único artista do álbum
-                    musica.artistas.append(artista)
-                    session.commit()
-                    print(f"Música '{nome_musica}' associada ao artista '{artista.nome}' no álbum '{album.nome}'!")
+                    artista = session.get(Artista, artista_id)
+                    if artista:
+                        # Associar o artista à música
+                        musica.artistas.append(artista)
+                        print(f"Música '{nome_musica}' associada ao artista '{artista.nome}' na coletânea '{album.nome}'!")
+                    else:
+                        print("Artista não encontrado.")
                 else:
-                    print("Nenhum artista associado ao álbum. Atualize o álbum com um artista.")
+                    # Para álbuns de um único artista, associar o artista ao álbum
+                    if musica.artistas:
+                        artista = musica.artistas[0]  # O único artista do álbum
+                        print(f"Música '{nome_musica}' associada ao artista '{artista.nome}' no álbum '{album.nome}'!")
+                    else:
+                        print("Nenhum artista associado ao álbum. Atualize o álbum com um artista.")
+
+                session.commit()
+            except Exception as erro:
+                session.rollback()
+                print(f"Cadastro da música cancelado ({erro}). Nenhuma informação foi gravada.")
+            except BaseException:
+                session.rollback()
+                raise
 
         else:
             print("Álbum não encontrado.")
@@ -354,104 +1719,106 @@ def update_info(session):
 
         choice = input("Digite sua escolha: ")
 
-        if choice == '1':
-            # Atualizar Artista
-            show_artista(session)
-            artista_id = input("Digite o ID do artista que deseja atualizar: ")
-            artista = session.get(Artista, artista_id)
-            if artista:
-                novo_nome = input(f"Nome atual: {artista.nome}. Digite o novo nome (ou Enter para manter o atual): ")
-                if novo_nome:
-                    artista.nome = novo_nome
-                session.commit()
-                print("Artista atualizado com sucesso!")
-            else:
-                print("Artista não encontrado.")
-
-        elif choice == '2':
-            # Atualizar Álbum e associar Artista
-            show_album(session)
-            album_id = input("Digite o ID do álbum que deseja atualizar: ")
-            album = session.get(Album, album_id)
-            if album:
-                novo_nome = input(f"Nome atual: {album.nome}. Digite o novo nome (ou Enter para manter o atual): ")
-                novo_ano = input(f"Ano atual: {album.ano_lancamento}. Digite o novo ano (ou Enter para manter o atual): ")
-                if novo_nome:
-                    album.nome = novo_nome
-                if novo_ano:
-                    album.ano_lancamento = novo_ano
-
-                # Associar artista ao álbum
-                show_artista(session)
-                artista_id = input("Digite o ID do artista para associar ao álbum ou pressione Enter para manter o atual: ")
-                if artista_id:
-                    artista = session.get(Artista, artista_id)
-                    if artista:
-                        # Verificar se o artista já está associado ao álbum
-                        if artista not in album.artistas:
-                            album.artistas.append(artista)
-                            session.commit()
-                            print(f"Álbum '{album.nome}' associado ao artista '{artista.nome}' com sucesso!")
-                    else:
-                        print("Artista não encontrado.")
+        # Cada atualização é uma única transação: as alterações e associações são confirmadas com um
+        # único commit e desfeitas por completo em caso de erro
+        try:
+            if choice == '1':
+                # Atualizar Artista
+                artista_id = input_id(session, Artista, "Digite o ID ou o início do nome do artista que deseja atualizar: ")
+                artista = session.get(Artista, artista_id)
+                if artista:
+                    novo_nome = input(f"Nome atual: {artista.nome}. Digite o novo nome (ou Enter para manter o atual): ")
+                    if novo_nome:
+                        artista.nome = novo_nome
+                    session.commit()
+                    print("Artista atualizado com sucesso!")
+                else:
+                    print("Artista não encontrado.")
 
-                session.commit()
-                print("Álbum atualizado com sucesso!")
-            else:
-                print("Álbum não encontrado.")
+            elif choice == '2':
+                # Atualizar Álbum e associar Artista
+                album_id = input_id(session, Album, "Digite o ID ou o início do nome do álbum que deseja atualizar: ")
+                album = session.get(Album, album_id)
+                if album:
+                    novo_nome = input(f"Nome atual: {album.nome}. Digite o novo nome (ou Enter para manter o atual): ")
+                    novo_ano = input(f"Ano atual: {album.ano_lancamento}. Digite o novo ano (ou Enter para manter o atual): ")
+                    if novo_nome:
+                        album.nome = novo_nome
+                    if novo_ano:
+                        album.ano_lancamento = int(novo_ano)
+
+                    # Associar artista ao álbum
+                    artista_id = input_id(session, Artista, "Digite o ID ou o início do nome do artista para associar ao álbum ou pressione Enter para manter o atual: ")
+                    if artista_id:
+                        artista = session.get(Artista, artista_id)
+                        if artista:
+                            # Verificar se o artista já está associado ao álbum
+                            if artista not in album.artistas:
+                                album.artistas.append(artista)
+                                print(f"Álbum '{album.nome}' associado ao artista '{artista.nome}' com sucesso!")
+                        else:
+                            print("Artista não encontrado.")
 
-        elif choice == '3':
-            # Atualizar Gênero
-            show_genero(session)
-            genero_id = input("Digite o ID do gênero que deseja atualizar: ")
-            genero = session.get(Genero, genero_id)
-            if genero:
-                novo_nome = input(f"Nome atual: {genero.nome}. Digite o novo nome (ou Enter para manter o atual): ")
-                if novo_nome:
-                    genero.nome = novo_nome
-                session.commit()
-                print("Gênero atualizado com sucesso!")
-            else:
-                print("Gênero não encontrado.")
+                    session.commit()
+                    print("Álbum atualizado com sucesso!")
+                else:
+                    print("Álbum não encontrado.")
+
+            elif choice == '3':
+                # Atualizar Gênero
+                genero_id = input_id(session, Genero, "Digite o ID ou o início do nome do gênero que deseja atualizar: ")
+                genero = session.get(Genero, genero_id)
+                if genero:
+                    novo_nome = input(f"Nome atual: {genero.nome}. Digite o novo nome (ou Enter para manter o atual): ")
+                    if novo_nome:
+                        genero.nome = novo_nome
+                    session.commit()
+                    print("Gênero atualizado com sucesso!")
+                else:
+                    print("Gênero não encontrado.")
+
+            elif choice == '4':
+                # Atualizar Música e Associar Artista
+                musica_id = input_id(session, Musica, "Digite o ID ou o início do nome da música que deseja atualizar: ")
+                musica = session.get(Musica, musica_id)
+                if musica:
+                    # Atualizar os atributos da música
+                    novo_nome = input(f"Nome atual: {musica.nome}. Digite o novo nome (ou Enter para manter o atual): ")
+                    duracao_atual = musica.duracao if musica.duracao is not None else "não informada"
+                    nova_duracao = input(f"Duração atual: {duracao_atual}. Digite a nova duração (ou Enter para manter o atual): ")
+                    nova_faixa = input(f"Faixa atual: {musica.faixa}. Digite a nova faixa (ou Enter para manter a atual): ")
+                    if novo_nome:
+                        musica.nome = novo_nome
+                    if nova_duracao:
+                        musica.duracao = int(nova_duracao)
+                    if nova_faixa:
+                        musica.faixa = int(nova_faixa)
+
+                    # Associar artista à música
+                    artista_id = input_id(session, Artista, "Digite o ID ou o início do nome do artista para associar à música ou pressione Enter para manter o atual: ")
+                    if artista_id:
+                        artista = session.get(Artista, artista_id)
+                        if artista:
+                            # Verificar se o artista já está associado à música
+                            if artista not in musica.artistas:
+                                musica.artistas.append(artista)
+                                print(f"Música '{musica.nome}' associada ao artista '{artista.nome}' com sucesso!")
+                        else:
+                            print("Artista não encontrado.")
 
-        elif choice == '4':
-            # Atualizar Música e Associar Artista
-            show_musica(session)
-            musica_id = input("Digite o ID da música que deseja atualizar: ")
-            musica = session.get(Musica, musica_id)
-            if musica:
-                # Atualizar os atributos da música
-                novo_nome = input(f"Nome atual: {musica.nome}. Digite o novo nome (ou Enter para manter o atual): ")
-                nova_duracao = input(f"Duração atual: {musica.duracao}. Digite a nova duração (ou Enter para manter o atual): ")
-                nova_faixa = input(f"Faixa atual: {musica.faixa}. Digite a nova faixa (ou Enter para manter a atual): ")
-                if novo_nome:
-                    musica.nome = novo_nome
-                if nova_duracao:
-                    musica.duracao = int(nova_duracao)
-                if nova_faixa:
-                    musica.faixa = int(nova_faixa)
-
-                # Mostrar artistas existentes e associar à música
-                show_artista(session)
-                artista_id = input("Digite o ID do artista para associar à música ou pressione Enter para manter o atual: ")
-                if artista_id:
-                    artista = session.get(Artista, artista_id)
-                    if artista:
-                        # Verificar se o artista já está associado à música
-                        if artista not in musica.artistas:
-                            musica.artistas.append(artista)
-                            session.commit()
-                            print(f"Música '{musica.nome}' associada ao artista '{artista.nome}' com sucesso!")
-                    else:
-                        print("Artista não encontrado.")
+                    session.commit()
+                    print("Música atualizada com sucesso!")
+                else:
+                    print("Música não encontrada.")
 
-                session.commit()
-                print("Música atualizada com sucesso!")
             else:
-                print("Música não encontrada.")
-
-        else:
-            print("Opção inválida.")
+                print("Opção inválida.")
+        except Exception as erro:
+            session.rollback()
+            print(f"Atualização cancelada ({erro}). Nenhuma informação foi alterada.")
+        except BaseException:
+            session.rollback()
+            raise
 
 # Função para excluir informações no banco de dados
 def delete_info(session):
@@ -463,64 +1830,1028 @@ def delete_info(session):
         print("2. Excluir Álbum")
         print("3. Excluir Gênero")
         print("4. Excluir Música")
+        print("5. Exclusão em massa (álbuns ou músicas por filtro)")
 
         choice = input("Digite sua escolha: ")
 
         if choice == '1':
             # Excluir Artista
-            show_artista(session)
-            artista_id = input("Digite o ID do artista que deseja excluir: ")
-            artista = session.get(Artista, artista_id)
-            if artista:
-                session.delete(artista)
+            artista_id = input_id(session, Artista, "Digite o ID ou o início do nome do artista que deseja excluir: ")
+            try:
+                excluir_artista(session, artista_id)
                 session.commit()
                 print("Artista excluído com sucesso!")
-            else:
+            except LookupError:
                 print("Artista não encontrado.")
 
         elif choice == '2':
             # Excluir Álbum
-            show_album(session)
-            album_id = input("Digite o ID do álbum que deseja excluir: ")
-            album = session.get(Album, album_id)
-            if album:
-                session.delete(album)
+            album_id = input_id(session, Album, "Digite o ID ou o início do nome do álbum que deseja excluir: ")
+            try:
+                excluir_album(session, album_id)
                 session.commit()
                 print("Álbum excluído com sucesso!")
-            else:
+            except LookupError:
                 print("Álbum não encontrado.")
 
         elif choice == '3':
             # Excluir Gênero
-            show_genero(session)
-            genero_id = input("Digite o ID do gênero que deseja excluir: ")
-            genero = session.get(Genero, genero_id)
-            if genero:
-                session.delete(genero)
+            genero_id = input_id(session, Genero, "Digite o ID ou o início do nome do gênero que deseja excluir: ")
+            try:
+                excluir_genero(session, genero_id)
                 session.commit()
                 print("Gênero excluído com sucesso!")
-            else:
+            except LookupError:
                 print("Gênero não encontrado.")
 
         elif choice == '4':
             # Excluir Música
-            show_musica(session)
-            musica_id = input("Digite o ID da música que deseja excluir: ")
-            musica = session.get(Musica, musica_id)
-            if musica:
-                session.delete(musica)
+            musica_id = input_id(session, Musica, "Digite o ID ou o início do nome da música que deseja excluir: ")
+            try:
+                excluir_musica(session, musica_id)
                 session.commit()
                 print("Música excluída com sucesso!")
-            else:
+            except LookupError:
                 print("Música não encontrada.")
 
+        elif choice == '5':
+            delete_em_massa(session)
+
         else:
             print("Opção inválida.")
 
-# Função principal para interação
-def main():
-    engine = setup_database()
+# Função para excluir álbuns ou músicas por filtro, com um único DELETE após a confirmação
+def delete_em_massa(session):
+    print("1. Álbuns")
+    print("2. Músicas")
+    tipo = input("O que deseja excluir? ")
+    print("Informe os filtros (Enter para ignorar um filtro).")
+    try:
+        if tipo == '1':
+            entidade, rotulo = Album, "álbum(ns)"
+            filtros = filtros_albuns(antes_de=_inteiro(input("Lançados antes do ano: ")),
+                                     a_partir_de=_inteiro(input("Lançados a partir do ano: ")),
+                                     artista_id=_inteiro(input("ID do artista: ")))
+        elif tipo == '2':
+            entidade, rotulo = Musica, "música(s)"
+            filtros = filtros_musicas(genero_id=_inteiro(input("ID do gênero (0 para as músicas sem gênero): ")),
+                                      album_id=_inteiro(input("ID do álbum: ")),
+                                      artista_id=_inteiro(input("ID do artista: ")),
+                                      antes_de=_inteiro(input("De álbuns lançados antes do ano: ")))
+        else:
+            print("Opção inválida.")
+            return
+    except ValueError:
+        print("Valor inválido: informe um número.")
+        return
+
+    if not filtros:
+        print("Nenhum filtro informado; nada foi excluído.")
+        return
+    total = contar_em_massa(session, entidade, filtros)
+    if total == 0:
+        print("Nenhum registro corresponde aos filtros.")
+        return
+    if input(f"{total} {rotulo} serão excluídos(as). Confirmar? (s/n): ").lower() != 's':
+        print("Exclusão cancelada.")
+        return
+    try:
+        excluidos = _excluir_em_massa(session, entidade, filtros)
+        session.commit()
+        print(f"{excluidos} {rotulo} excluídos(as) com sucesso!")
+    except SQLAlchemyError as erro:
+        session.rollback()
+        print(f"Erro na exclusão em massa: {getattr(erro, 'orig', erro)}")
+
+# Quantidade de registros gravados por transação na importação em lote
+IMPORT_LOTE = 10000
+
+# Quantidade máxima de parâmetros por consulta IN (limite de variáveis do SQLite)
+LIMITE_PARAMETROS = 500
+
+# Valores aceitos como "sim" na coluna coletanea dos arquivos importados
+VALORES_VERDADEIROS = {'s', 'sim', 'y', 'yes', 'true', '1'}
+
+# Função para ler os registros de um arquivo CSV ou JSONL, um de cada vez
+def ler_registros(caminho, formato=None):
+    if formato is None:
+        formato = 'jsonl' if caminho.lower().endswith(('.jsonl', '.json')) else 'csv'
+    with open(caminho, encoding='utf-8', newline='') as arquivo:
+        if formato == 'jsonl':
+            for linha in arquivo:
+                if linha.strip():
+                    yield json.loads(linha)
+        else:
+            yield from csv.DictReader(arquivo)
+
+# Chave de comparação equivalente ao COLLATE NOCASE do SQLite (que só ignora a caixa de letras ASCII)
+_MINUSCULAS_ASCII = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def chave_nome(nome):
+    return nome.translate(_MINUSCULAS_ASCII)
+
+# Funções auxiliares para normalizar os campos lidos dos arquivos
+def _texto(valor):
+    if valor is None:
+        return None
+    valor = str(valor).strip()
+    return valor or None
+
+def _inteiro(valor):
+    valor = _texto(valor)
+    return int(valor) if valor is not None else None
+
+def _booleano(valor):
+    if isinstance(valor, bool):
+        return valor
+    valor = _texto(valor)
+    return valor is not None and valor.lower() in VALORES_VERDADEIROS
+
+def _lista_artistas(valor):
+    if valor is None:
+        return []
+    if isinstance(valor, str):
+        valor = valor.split(';')
+    nomes = []
+    for nome in valor:
+        nome = _texto(nome)
+        if nome and nome not in nomes:
+            nomes.append(nome)
+    return nomes
+
+# Importador em lote do catálogo
+# Cada registro do arquivo descreve uma faixa (campos artista, album, ano, coletanea, faixa, musica,
+# duracao e genero); registros sem música cadastram apenas o artista, o gênero ou o álbum.
+# Vários artistas podem ser informados separados por ";" (ou como lista no JSONL).
+# Os nomes de artistas e gêneros são resolvidos para IDs por um cache em memória, sem diferenciar
+# maiúsculas/minúsculas (como o índice NOCASE), consultando o banco uma única vez por lote, e as linhas
+# de todas as tabelas são gravadas com executemany em uma transação por lote. Os IDs novos são atribuídos
+# a partir do maior ID existente, por isso a importação deve ser a única escrita no banco enquanto estiver
+# em andamento.
+class ImportadorCatalogo:
+    def __init__(self, session, lote=IMPORT_LOTE):
+        self.session = session
+        self.lote = lote
+        self.artistas = {}  # chave_nome(nome) -> id
+        self.generos = {}  # chave_nome(nome) -> id
+        self.albuns = {}  # (nome, ano, coletanea, artista principal) -> id
+        self.artista_album = set()  # pares (artista_id, album_id) já gravados nesta importação
+        self.proximo_id = {
+            tabela: (session.execute(select(func.max(tabela.c.id))).scalar() or 0) + 1
+            for tabela in (Artista.__table__, Album.__table__, Musica.__table__, Genero.__table__)
+        }
+        self.totais = {'artistas': 0, 'generos': 0, 'albuns': 0, 'musicas': 0}
+
+    def _novo_id(self, tabela):
+        novo_id = self.proximo_id[tabela]
+        self.proximo_id[tabela] = novo_id + 1
+        return novo_id
+
+    # Resolve os nomes ainda desconhecidos do lote com uma consulta IN por bloco de nomes, usando o
+    # índice NOCASE de nome, e reserva IDs para os que não existem no banco
+    def _resolver_nomes(self, entidade, cache, nomes, novos):
+        faltantes = [nome for nome in nomes if chave_nome(nome) not in cache]
+        for inicio in range(0, len(faltantes), LIMITE_PARAMETROS):
+            bloco = faltantes[inicio:inicio + LIMITE_PARAMETROS]
+            consulta = (select(entidade.nome, func.min(entidade.id))
+                        .where(entidade.nome.collate('NOCASE').in_(bloco))
+                        .group_by(entidade.nome.collate('NOCASE')))
+            for nome, entidade_id in self.session.execute(consulta):
+                cache[chave_nome(nome)] = entidade_id
+        for nome in faltantes:
+            if chave_nome(nome) not in cache:
+                cache[chave_nome(nome)] = self._novo_id(entidade.__table__)
+                novos.append({'id': cache[chave_nome(nome)], 'nome': nome})
+
+    def _gravar_lote(self, registros):
+        registros = [
+            {
+                'artistas': _lista_artistas(registro.get('artistas', registro.get('artista'))),
+                'album': _texto(registro.get('album')),
+                'ano': _inteiro(registro.get('ano', registro.get('ano_lancamento'))),
+                'coletanea': _booleano(registro.get('coletanea')),
+                'faixa': _inteiro(registro.get('faixa')),
+                'musica': _texto(registro.get('musica')),
+                'duracao': _inteiro(registro.get('duracao')),
+                'genero': _texto(registro.get('genero')),
+            }
+            for registro in registros
+        ]
+
+        novos_artistas, novos_generos, novos_albuns, novas_musicas = [], [], [], []
+        novos_artista_album, novos_artista_musica = [], []
+
+        self._resolver_nomes(Artista, self.artistas,
+                             {nome for registro in registros for nome in registro['artistas']}, novos_artistas)
+        self._resolver_nomes(Genero, self.generos,
+                             {registro['genero'] for registro in registros if registro['genero']}, novos_generos)
+
+        for registro in registros:
+            artista_ids = list(dict.fromkeys(self.artistas[chave_nome(nome)] for nome in registro['artistas']))
+            genero_id = self.generos[chave_nome(registro['genero'])] if registro['genero'] else None
+
+            album_id = None
+            if registro['album']:
+                # Álbuns solo são identificados também pelo artista principal
+                principal = None if registro['coletanea'] or not artista_ids else artista_ids[0]
+                chave = (registro['album'], registro['ano'], registro['coletanea'], principal)
+                album_id = self.albuns.get(chave)
+                if album_id is None:
+                    album_id = self.albuns[chave] = self._novo_id(Album.__table__)
+                    novos_albuns.append({'id': album_id, 'nome': registro['album'],
+                                         'ano_lancamento': registro['ano'], 'coletanea': registro['coletanea']})
+                # Assim como no cadastro interativo, coletâneas associam os artistas apenas às músicas
+                if not registro['coletanea']:
+                    for artista_id in artista_ids:
+                        if (artista_id, album_id) not in self.artista_album:
+                            self.artista_album.add((artista_id, album_id))
+                            novos_artista_album.append({'artista_id': artista_id, 'album_id': album_id})
+
+            if registro['musica']:
+                musica_id = self._novo_id(Musica.__table__)
+                novas_musicas.append({'id': musica_id, 'nome': registro['musica'], 'duracao': registro['duracao'],
+                                      'faixa': registro['faixa'], 'album_id': album_id, 'genero_id': genero_id})
+                novos_artista_musica.extend({'artista_id': artista_id, 'musica_id': musica_id}
+                                            for artista_id in artista_ids)
+
+        try:
+            for tabela, linhas in ((Artista.__table__, novos_artistas), (Genero.__table__, novos_generos),
+                                   (Album.__table__, novos_albuns), (Musica.__table__, novas_musicas),
+                                   (artista_album, novos_artista_album), (artista_musica, novos_artista_musica)):
+                if linhas:
+                    self.session.execute(insert(tabela), linhas)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+
+        self.totais['artistas'] += len(novos_artistas)
+        self.totais['generos'] += len(novos_generos)
+        self.totais['albuns'] += len(novos_albuns)
+        self.totais['musicas'] += len(novas_musicas)
+
+    def importar(self, registros):
+        registros = iter(registros)
+        while True:
+            lote = list(islice(registros, self.lote))
+            if not lote:
+                break
+            self._gravar_lote(lote)
+        return self.totais
+
+# Função para importar um arquivo CSV ou JSONL para o catálogo
+def import_file(session, caminho, formato=None, lote=IMPORT_LOTE):
+    return ImportadorCatalogo(session, lote).importar(ler_registros(caminho, formato))
+
+# Importação paralela
+# O arquivo é dividido em faixas de bytes (cortadas no início de uma linha, por isso cada registro deve ocupar
+# uma linha) e cada processo importa a sua faixa com o ImportadorCatalogo para um banco de preparação próprio,
+# com o mesmo esquema do catálogo. No final os bancos de preparação são anexados (ATTACH) ao banco principal e
+# copiados em uma única transação: artistas e gêneros são unificados pelo nome (sem diferenciar maiúsculas/
+# minúsculas), álbuns divididos entre duas faixas são unificados pela mesma chave do importador e os IDs de
+# cada banco de preparação são remapeados para os do banco principal.
+
+# Função para ler os registros de uma faixa de bytes do arquivo; a faixa começa na primeira linha iniciada em
+# `inicio` ou depois dele e vai até a última linha iniciada antes de `fim`
+def ler_fragmento(caminho, formato, inicio, fim):
+    with open(caminho, 'rb') as arquivo:
+        colunas = next(csv.reader([arquivo.readline().decode('utf-8')])) if formato == 'csv' else None
+        if inicio > 0:
+            arquivo.seek(inicio - 1)
+            arquivo.readline()
+        linhas = []
+        while arquivo.tell() < fim and (linha := arquivo.readline()):
+            linhas.append(linha.decode('utf-8'))
+            if len(linhas) == IMPORT_LOTE:
+                yield from _registros_linhas(linhas, formato, colunas)
+                linhas = []
+        yield from _registros_linhas(linhas, formato, colunas)
+
+def _registros_linhas(linhas, formato, colunas):
+    if formato == 'jsonl':
+        return (json.loads(linha) for linha in linhas if linha.strip())
+    return csv.DictReader(linhas, fieldnames=colunas)
+
+# Função executada em cada processo: importa uma faixa do arquivo para um banco de preparação novo
+def _importar_fragmento(caminho, formato, inicio, fim, destino, lote):
+    engine = create_engine(f"sqlite:///{destino}")
+    aplicar_pragmas(engine, pragmas_perfil('bulk-load'))
+    controlar_transacoes(engine)
+    Base.metadata.create_all(engine, tables=TABELAS_CATALOGO)
     session = start_session(engine)
+    try:
+        return ImportadorCatalogo(session, lote).importar(ler_fragmento(caminho, formato, inicio, fim))
+    finally:
+        session.close()
+        engine.dispose()
+
+# Comandos da cópia de um banco de preparação (anexado como "estagio") para o banco principal; :estagio é o
+# número do banco de preparação e :base_albuns/:base_musicas os maiores IDs do banco principal antes da cópia.
+# O CROSS JOIN fixa a ordem das junções (as tabelas do banco de preparação são percorridas e as de mapeamento
+# consultadas pela chave), já que as tabelas temporárias não têm estatísticas para o planejador.
+COMANDOS_MESCLAGEM = [
+    # Artistas e gêneros: cadastra os nomes novos e mapeia cada ID de preparação para o ID do banco principal
+    *(comando
+      for tabela in ('artistas', 'generos')
+      for comando in (
+          f"INSERT INTO main.{tabela} (nome) SELECT e.nome FROM estagio.{tabela} e "
+          f"WHERE NOT EXISTS (SELECT 1 FROM main.{tabela} t WHERE t.nome = e.nome COLLATE NOCASE) ORDER BY e.id",
+          f"INSERT INTO temp.mapa_{tabela} (estagio, antigo, novo) SELECT :estagio, e.id, "
+          f"(SELECT min(t.id) FROM main.{tabela} t WHERE t.nome = e.nome COLLATE NOCASE) FROM estagio.{tabela} e",
+      )),
+    # Álbuns: a chave é a mesma do importador (nome, ano, coletânea e artista principal dos álbuns solo, que é o
+    # primeiro artista associado ao álbum no banco de preparação)
+    "CREATE TEMP TABLE albuns_estagio AS "
+    "SELECT e.id AS antigo, e.nome, e.ano_lancamento AS ano, e.coletanea, "
+    "CASE WHEN e.coletanea THEN NULL ELSE (SELECT m.novo FROM estagio.artista_album aa "
+    "JOIN temp.mapa_artistas m ON m.estagio = :estagio AND m.antigo = aa.artista_id "
+    "WHERE aa.album_id = e.id ORDER BY aa.rowid LIMIT 1) END AS principal FROM estagio.albuns e",
+    "INSERT INTO temp.mapa_albuns (estagio, antigo, novo) SELECT :estagio, s.antigo, i.id "
+    "FROM temp.albuns_estagio s CROSS JOIN temp.albuns_importados i ON i.nome = s.nome AND i.ano IS s.ano "
+    "AND i.coletanea = s.coletanea AND i.principal IS s.principal",
+    "INSERT INTO temp.mapa_albuns (estagio, antigo, novo) "
+    "SELECT :estagio, s.antigo, :base_albuns + row_number() OVER (ORDER BY s.antigo) FROM temp.albuns_estagio s "
+    "WHERE NOT EXISTS (SELECT 1 FROM temp.mapa_albuns m WHERE m.estagio = :estagio AND m.antigo = s.antigo)",
+    "INSERT INTO main.albuns (id, nome, ano_lancamento, coletanea) SELECT m.novo, s.nome, s.ano, s.coletanea "
+    "FROM temp.albuns_estagio s JOIN temp.mapa_albuns m ON m.estagio = :estagio AND m.antigo = s.antigo "
+    "WHERE m.novo > :base_albuns ORDER BY m.novo",
+    "INSERT INTO temp.albuns_importados (nome, ano, coletanea, principal, id) "
+    "SELECT s.nome, s.ano, s.coletanea, s.principal, m.novo FROM temp.albuns_estagio s "
+    "JOIN temp.mapa_albuns m ON m.estagio = :estagio AND m.antigo = s.antigo WHERE m.novo > :base_albuns",
+    "DROP TABLE temp.albuns_estagio",
+    # Músicas: os IDs de preparação são deslocados pelo maior ID do banco principal
+    "INSERT INTO main.musicas (id, nome, duracao, faixa, album_id, genero_id) "
+    "SELECT :base_musicas + e.id, e.nome, e.duracao, e.faixa, ma.novo, mg.novo FROM estagio.musicas e "
+    "LEFT JOIN temp.mapa_albuns ma ON ma.estagio = :estagio AND ma.antigo = e.album_id "
+    "LEFT JOIN temp.mapa_generos mg ON mg.estagio = :estagio AND mg.antigo = e.genero_id ORDER BY e.id",
+    "INSERT OR IGNORE INTO main.artista_album (artista_id, album_id) SELECT mar.novo, mal.novo "
+    "FROM estagio.artista_album x "
+    "CROSS JOIN temp.mapa_artistas mar ON mar.estagio = :estagio AND mar.antigo = x.artista_id "
+    "CROSS JOIN temp.mapa_albuns mal ON mal.estagio = :estagio AND mal.antigo = x.album_id ORDER BY x.rowid",
+    "INSERT OR IGNORE INTO main.artista_musica (artista_id, musica_id) SELECT mar.novo, :base_musicas + x.musica_id "
+    "FROM estagio.artista_musica x "
+    "CROSS JOIN temp.mapa_artistas mar ON mar.estagio = :estagio AND mar.antigo = x.artista_id ORDER BY x.rowid",
+]
+
+# Gatilhos dos dados derivados (estatísticas, agregados e busca), suspensos durante a cópia
+FAMILIAS_GATILHOS_DERIVADOS = ('tg_estatisticas_%', 'tg_agregados_%', 'tg_busca_%')
+
+# Função para copiar os bancos de preparação para o banco principal em uma única transação
+# Os gatilhos dos dados derivados são suspensos durante a cópia (seriam executados linha a linha) e os dados
+# derivados são recalculados com consultas agrupadas no final, na mesma transação; o índice de busca recebe
+# apenas os registros novos. O ATTACH não pode ser feito dentro de uma transação, por isso todos os bancos
+# são anexados antes dela.
+def mesclar_preparacao(engine, caminhos):
+    with engine.connect() as conexao:
+        cursor = conexao.connection.cursor()
+        for indice, caminho in enumerate(caminhos):
+            cursor.execute(f"ATTACH DATABASE ? AS estagio_{indice}", (caminho,))
+        try:
+            with conexao.begin():
+                antes = {tabela: conexao.exec_driver_sql(f"SELECT count(*), coalesce(max(id), 0) FROM main.{tabela}")
+                         .one() for tabela in ('artistas', 'generos', 'albuns', 'musicas')}
+                gatilhos = conexao.exec_driver_sql(
+                    "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND ("
+                    + " OR ".join("name LIKE ?" for _ in FAMILIAS_GATILHOS_DERIVADOS) + ")",
+                    FAMILIAS_GATILHOS_DERIVADOS).all()
+                for nome, _sql in gatilhos:
+                    conexao.exec_driver_sql(f"DROP TRIGGER {nome}")
+
+                for tabela in ('artistas', 'generos', 'albuns'):
+                    conexao.exec_driver_sql(f"CREATE TEMP TABLE mapa_{tabela} (estagio INTEGER, antigo INTEGER, "
+                                            f"novo INTEGER, PRIMARY KEY (estagio, antigo))")
+                conexao.exec_driver_sql("CREATE TEMP TABLE albuns_importados (nome TEXT, ano INTEGER, coletanea INTEGER, "
+                                        "principal INTEGER, id INTEGER)")
+                conexao.exec_driver_sql(
+                    "CREATE INDEX temp.ix_albuns_importados ON albuns_importados (nome, ano, coletanea, principal)")
+                for indice in range(len(caminhos)):
+                    parametros = {
+                        'estagio': indice,
+                        'base_albuns': conexao.exec_driver_sql(
+                            "SELECT coalesce(max(id), 0) FROM main.albuns").scalar(),
+                        'base_musicas': conexao.exec_driver_sql(
+                            "SELECT coalesce(max(id), 0) FROM main.musicas").scalar(),
+                    }
+                    for comando in COMANDOS_MESCLAGEM:
+                        conexao.exec_driver_sql(comando.replace("estagio.", f"estagio_{indice}."), parametros)
+                for tabela in ('mapa_artistas', 'mapa_generos', 'mapa_albuns', 'albuns_importados'):
+                    conexao.exec_driver_sql(f"DROP TABLE temp.{tabela}")
+
+                for _nome, sql in gatilhos:
+                    conexao.exec_driver_sql(sql)
+                rebuild_estatisticas(conexao)
+                rebuild_agregados(conexao)
+                for tabela, tabela_busca in TABELAS_BUSCA.items():
+                    conexao.exec_driver_sql(f"INSERT INTO {tabela_busca} (rowid, nome) "
+                                            f"SELECT id, nome FROM main.{tabela} WHERE id > ?", (antes[tabela][1],))
+                return {tabela: conexao.exec_driver_sql(f"SELECT count(*) FROM main.{tabela}").scalar() - total
+                        for tabela, (total, _maximo) in antes.items()}
+        finally:
+            for indice in range(len(caminhos)):
+                cursor.execute(f"DETACH DATABASE estagio_{indice}")
+
+# Função para importar um arquivo CSV ou JSONL com vários processos
+# A quantidade de processos é limitada pela de bancos que o SQLite consegue anexar de uma vez
+def import_file_paralelo(session, caminho, formato=None, processos=None, lote=IMPORT_LOTE):
+    if formato is None:
+        formato = 'jsonl' if caminho.lower().endswith(('.jsonl', '.json')) else 'csv'
+    limite_anexos = sqlite3.connect(':memory:').getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    processos = max(1, min(processos or os.cpu_count() or 1, limite_anexos))
+
+    tamanho = os.path.getsize(caminho)
+    with open(caminho, 'rb') as arquivo:
+        inicio_dados = len(arquivo.readline()) if formato == 'csv' else 0
+    limites = [inicio_dados + (tamanho - inicio_dados) * indice // processos for indice in range(processos + 1)]
+
+    # Importados aqui por serem usados só neste modo (o multiprocessing atrasa a inicialização do programa)
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    with tempfile.TemporaryDirectory(prefix='importacao_') as diretorio:
+        caminhos = [os.path.join(diretorio, f"preparacao_{indice}.db") for indice in range(processos)]
+        with ProcessPoolExecutor(processos) as executor:
+            list(executor.map(_importar_fragmento, [caminho] * processos, [formato] * processos, limites[:-1],
+                              limites[1:], caminhos, [lote] * processos))
+        # A transação da sessão é encerrada para não bloquear a cópia, feita em uma conexão própria
+        session.commit()
+        return mesclar_preparacao(session.get_bind(), caminhos)
+
+def import_catalogo(session):
+    caminho = input("Caminho do arquivo (.csv ou .jsonl): ").strip()
+    if not os.path.isfile(caminho):
+        print("Arquivo não encontrado.")
+        return
+    processos = input("Quantidade de processos (Enter para 1; use mais de 1 em arquivos grandes): ").strip()
+
+    inicio = time.perf_counter()
+    try:
+        if processos and int(processos) > 1:
+            totais = import_file_paralelo(session, caminho, processos=int(processos))
+        else:
+            totais = import_file(session, caminho)
+    except (OSError, ValueError, KeyError) as erro:
+        print(f"Erro ao importar o arquivo: {erro}")
+        return
+    except SQLAlchemyError as erro:
+        session.rollback()
+        print(f"Erro ao gravar o catálogo: {erro}")
+        return
+    decorrido = time.perf_counter() - inicio
+
+    print(f"Importação concluída em {decorrido:.2f} segundos: {totais['artistas']} artistas, "
+          f"{totais['albuns']} álbuns, {totais['musicas']} músicas e {totais['generos']} gêneros cadastrados.")
+
+# Exportação do catálogo
+# As consultas são lidas em fluxo (yield_per) e gravadas em blocos de EXPORT_LOTE linhas, então a memória
+# usada não depende do tamanho do catálogo. Todos os arquivos saem da mesma transação de leitura.
+EXPORT_LOTE = 10000
+
+# Compressões aceitas por formato (CSV e JSONL são comprimidos no arquivo inteiro; Parquet por coluna)
+COMPRESSOES_TEXTO = {None: open, 'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+EXTENSOES_COMPRESSAO = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz'}
+COMPRESSOES_PARQUET = (None, 'none', 'snappy', 'gzip', 'zstd', 'brotli', 'lz4')
+
+# Visão desnormalizada das músicas; as colunas artistas, album, ano, coletanea, faixa, musica, duracao e
+# genero seguem o formato do importador, então o arquivo exportado pode ser importado em outro banco
+def consulta_exportacao_musicas():
+    return (
+        select(Musica.id.label('musica_id'), Musica.nome.label('musica'), Musica.faixa, Musica.duracao,
+               func.group_concat(Artista.nome, '; ', type_=String).label('artistas'),
+               Album.id.label('album_id'), Album.nome.label('album'), Album.ano_lancamento.label('ano'),
+               Album.coletanea, Genero.id.label('genero_id'), Genero.nome.label('genero'))
+        .select_from(Musica)
+        .outerjoin(Album, Album.id == Musica.album_id)
+        .outerjoin(Genero, Genero.id == Musica.genero_id)
+        .outerjoin(artista_musica, artista_musica.c.musica_id == Musica.id)
+        .outerjoin(Artista, Artista.id == artista_musica.c.artista_id)
+        .group_by(Musica.id)
+        .order_by(Musica.id)
+    )
+
+@contextmanager
+def _escritor_csv(caminho, colunas, _tipos, compressao):
+    with COMPRESSOES_TEXTO[compressao](caminho, 'wt', encoding='utf-8', newline='') as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(colunas)
+        yield escritor.writerows
+
+@contextmanager
+def _escritor_jsonl(caminho, colunas, _tipos, compressao):
+    with COMPRESSOES_TEXTO[compressao](caminho, 'wt', encoding='utf-8', newline='') as arquivo:
+        def gravar(linhas):
+            arquivo.writelines(json.dumps(dict(zip(colunas, linha)), ensure_ascii=False) + "\n" for linha in linhas)
+        yield gravar
+
+# O Parquet usa o pyarrow, dependência opcional importada só quando este formato é pedido
+@contextmanager
+def _escritor_parquet(caminho, colunas, tipos, compressao):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ValueError("A exportação em Parquet requer o pacote pyarrow (pip install pyarrow)") from None
+    tipos_arrow = {int: pyarrow.int64(), str: pyarrow.string(), bool: pyarrow.bool_()}
+    esquema = pyarrow.schema([(coluna, tipos_arrow[tipo]) for coluna, tipo in zip(colunas, tipos)])
+    with pyarrow.parquet.ParquetWriter(caminho, esquema, compression=compressao or 'snappy') as escritor:
+        def gravar(linhas):
+            valores = list(zip(*linhas))
+            escritor.write_batch(pyarrow.RecordBatch.from_arrays(
+                [pyarrow.array(coluna, type=campo.type) for coluna, campo in zip(valores, esquema)], schema=esquema))
+        yield gravar
+
+ESCRITORES_EXPORTACAO = {'csv': _escritor_csv, 'jsonl': _escritor_jsonl, 'parquet': _escritor_parquet}
+
+# Função para gravar o resultado de uma consulta em um arquivo, em blocos; devolve a quantidade de linhas
+def exportar_consulta(session, consulta, caminho, formato, compressao=None, lote=EXPORT_LOTE):
+    colunas = [coluna.key for coluna in consulta.selected_columns]
+    tipos = [coluna.type.python_type for coluna in consulta.selected_columns]
+    total = 0
+    resultado = session.execute(consulta, execution_options={'yield_per': lote})
+    with ESCRITORES_EXPORTACAO[formato](caminho, colunas, tipos, compressao) as gravar:
+        for linhas in resultado.partitions():
+            gravar(linhas)
+            total += len(linhas)
+    return total
+
+# Função para exportar a visão desnormalizada das músicas (musicas_completas) e as tabelas do catálogo para
+# um diretório; devolve a quantidade de linhas gravadas em cada arquivo
+def export_files(session, diretorio, formato='csv', compressao=None, lote=EXPORT_LOTE):
+    if formato not in ESCRITORES_EXPORTACAO:
+        raise ValueError(f"Formato de exportação inválido: {formato}")
+    if formato == 'parquet' and compressao not in COMPRESSOES_PARQUET:
+        raise ValueError(f"Compressão inválida para Parquet: {compressao}")
+    if formato != 'parquet' and compressao not in COMPRESSOES_TEXTO:
+        raise ValueError(f"Compressão inválida para {formato.upper()}: {compressao}")
+    os.makedirs(diretorio, exist_ok=True)
+
+    extensao = f".{formato}" + (EXTENSOES_COMPRESSAO.get(compressao, '') if formato != 'parquet' else '')
+    consultas = [('musicas_completas', consulta_exportacao_musicas())]
+    consultas += [(tabela.name, select(tabela).order_by(*tabela.primary_key.columns)) for tabela in TABELAS_CATALOGO]
+    return {
+        nome + extensao: exportar_consulta(session, consulta, os.path.join(diretorio, nome + extensao), formato,
+                                           compressao, lote)
+        for nome, consulta in consultas
+    }
+
+def export_catalogo(session):
+    diretorio = input("Diretório de destino: ").strip()
+    formato = input("Formato (csv, jsonl ou parquet) [csv]: ").strip().lower() or 'csv'
+    compressao = input("Compressão (Enter para nenhuma; gzip, bz2 ou xz; no Parquet: snappy, zstd, gzip...): ")
+    inicio = time.perf_counter()
+    try:
+        arquivos = export_files(session, diretorio, formato, compressao.strip().lower() or None)
+    except (ValueError, OSError) as erro:
+        print(f"Erro ao exportar o catálogo: {erro}")
+        return
+    show_table([[nome, linhas] for nome, linhas in arquivos.items()], ["Arquivo", "Linhas"])
+    print(f"Cursor de alterações: {cursor_alteracoes(session.connection())}")
+    print(f"Exportação concluída em {time.perf_counter() - inicio:.2f} segundos.")
+
+# Consultas usadas pelo programa, verificadas pelo diagnóstico de planos de execução.
+# Cada item informa a tabela que a consulta percorre inteira de propósito (as listagens completas);
+# qualquer outra varredura indica um índice faltando.
+def consultas_padrao():
+    return [
+        ("Acervo: artistas, álbuns e músicas", consulta_acervo_artistas(), 'artistas'),
+        ("Acervo: coletâneas", consulta_acervo_coletaneas(), None),
+        ("Listagem de músicas", consulta_listagem_musicas(), 'musicas'),
+        ("Músicas de um álbum", select(Musica).where(Musica.album_id == 1), None),
+        ("Músicas de um gênero", select(Musica).where(Musica.genero_id == 1), None),
+        ("Álbuns de um artista", select(artista_album).where(artista_album.c.artista_id == 1), None),
+        ("Artistas de um álbum", select(artista_album).where(artista_album.c.album_id == 1), None),
+        ("Músicas de um artista", select(artista_musica).where(artista_musica.c.artista_id == 1), None),
+        ("Artistas de uma música", select(artista_musica).where(artista_musica.c.musica_id == 1), None),
+        ("Artista por nome", select(Artista).where(Artista.nome.collate('NOCASE') == 'nome'), None),
+        ("Álbum por nome", select(Album).where(Album.nome.collate('NOCASE') == 'nome'), None),
+        ("Música por nome", select(Musica).where(Musica.nome.collate('NOCASE') == 'nome'), None),
+        ("Gênero por nome", select(Genero).where(Genero.nome.collate('NOCASE') == 'nome'), None),
+    ]
+
+# Função que executa EXPLAIN QUERY PLAN em uma consulta e devolve as linhas de detalhe do plano
+def plano_consulta(session, consulta):
+    conexao = session.connection()
+    compilada = consulta.compile(dialect=conexao.dialect)
+    parametros = tuple(compilada.params[nome] for nome in compilada.positiontup)
+    linhas = conexao.exec_driver_sql(f"EXPLAIN QUERY PLAN {compilada}", parametros)
+    return [linha[-1] for linha in linhas]
+
+# Função que verifica os planos das consultas padrão e aponta as que ainda varrem tabelas inteiras
+def check_query_plans(session):
+    resultados = []
+    for nome, consulta, varredura_esperada in consultas_padrao():
+        plano = plano_consulta(session, consulta)
+        varreduras = [
+            detalhe for detalhe in plano
+            if detalhe.startswith('SCAN ') and detalhe.split()[1] != varredura_esperada
+        ]
+        resultados.append((nome, plano, varreduras))
+    return resultados
+
+def show_query_plans(session):
+    resultados = check_query_plans(session)
+    data = [[nome, "\n".join(plano), "VARREDURA" if varreduras else "OK"]
+            for nome, plano, varreduras in resultados]
+    show_table(data, ["Consulta", "Plano", "Situação"])
+    total = sum(1 for _, _, varreduras in resultados if varreduras)
+    if total:
+        print(f"{total} consulta(s) ainda fazem varredura completa de tabela.")
+    else:
+        print("Todas as consultas usam índices.")
+
+# Instrumentação de SQL por ação do menu (--profile)
+# Mede cada comando (execução e leitura das linhas) pelos eventos before/after_cursor_execute do engine e
+# agrupa por "forma" do comando (o SQL com parâmetros, normalizado). Uma forma repetida muitas vezes na
+# mesma ação indica um N+1.
+LIMITE_N_MAIS_1 = 10
+
+# Comandos de controle de transação não contam como N+1 (um SAVEPOINT por faixa é o esperado)
+_CONTROLE_TRANSACAO = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK', 'COMMIT', 'PRAGMA')
+
+def forma_comando(sql):
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    sql = re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', sql)  # Listas de IN com tamanhos diferentes
+    return re.sub(r'sa_savepoint_\d+', 'sa_savepoint_N', sql)
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+# O sqlite3 não informa quantas linhas uma consulta devolveu, e no SQLite boa parte do trabalho acontece
+# durante a leitura das linhas; no modo --profile as conexões usam este cursor, que soma as linhas lidas e
+# o tempo de leitura na execução do comando que está em andamento
+class CursorInstrumentado(sqlite3.Cursor):
+    estatistica = None
+    indice = None
+
+    def _contar(self, quantidade, inicio):
+        if self.estatistica is not None:
+            self.estatistica['linhas'] += quantidade
+            self.estatistica['tempos'][self.indice] += time.perf_counter() - inicio
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        linha = super().fetchone()
+        self._contar(0 if linha is None else 1, inicio)
+        return linha
+
+    def fetchmany(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        linhas = super().fetchmany(*args, **kwargs)
+        self._contar(len(linhas), inicio)
+        return linhas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        self._contar(len(linhas), inicio)
+        return linhas
+
+# Pico de memória residente do processo em KB (None onde o módulo resource não existe, como no Windows)
+def memoria_maxima_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico // 1024 if sys.platform == 'darwin' else pico  # No macOS o valor vem em bytes
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+class InstrumentacaoSQL:
+    def __init__(self, limite=LIMITE_N_MAIS_1, log=None, saida=sys.stdout):
+        self.limite = limite
+        self.log = log
+        self.saida = saida
+        self.formas = None  # None fora de uma ação
+        self.session = None  # Sessão da ação em andamento, para a telemetria do mapa de identidade
+        self.pico_mapa = 0
+
+    def instrumentar(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def antes(_conexao, cursor, sql, _parametros, contexto, _executemany):
+            if self.formas is None:
+                return
+            estatistica = self.formas.setdefault(forma_comando(sql), {'execucoes': 0, 'tempos': [], 'linhas': 0})
+            estatistica['execucoes'] += 1
+            estatistica['tempos'].append(0.0)
+            indice = len(estatistica['tempos']) - 1
+            if isinstance(cursor, CursorInstrumentado):
+                cursor.estatistica, cursor.indice = estatistica, indice
+            contexto._instrumentacao = (estatistica, indice, time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def depois(_conexao, _cursor, _sql, _parametros, contexto, _executemany):
+            medicao = getattr(contexto, '_instrumentacao', None)
+            if medicao is None:
+                return
+            estatistica, indice, inicio = medicao
+            estatistica['tempos'][indice] += time.perf_counter() - inicio
+            if self.session is not None:
+                self.pico_mapa = max(self.pico_mapa, len(self.session.identity_map))
+
+    # Mede uma ação do menu; ao final mostra o resumo e grava uma linha JSON no log
+    # Com a sessão da ação, o resumo traz também o tamanho do mapa de identidade (no final da ação e o maior
+    # visto entre os comandos) e o pico de memória do processo: ao longo de uma execução longa, o log mostra
+    # se os objetos carregados se acumulam de uma ação para outra.
+    @contextmanager
+    def acao(self, nome, session=None):
+        self.formas = {}
+        self.session, self.pico_mapa = session, 0
+        inicio_data = time.time()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracao = time.perf_counter() - inicio
+            memoria = None
+            if session is not None:
+                tamanho = len(session.identity_map)
+                memoria = {'mapa_identidade': tamanho, 'pico_mapa_identidade': max(self.pico_mapa, tamanho),
+                           'memoria_maxima_kb': memoria_maxima_kb()}
+            resumo = self.resumo(nome, inicio_data, duracao, self.formas, memoria)
+            self.formas, self.session = None, None
+            self.mostrar(resumo)
+            if self.log:
+                with open(self.log, 'a', encoding='utf-8') as arquivo:
+                    arquivo.write(json.dumps(resumo, ensure_ascii=False) + "\n")
+
+    def resumo(self, nome, inicio, duracao, formas, memoria=None):
+        tempos = [tempo for estatistica in formas.values() for tempo in estatistica['tempos']]
+        comandos = [
+            {'sql': forma, 'execucoes': estatistica['execucoes'],
+             'tempo_ms': round(sum(estatistica['tempos']) * 1000, 3),
+             'p95_ms': round(percentil(estatistica['tempos'], 95) * 1000, 3), 'linhas': estatistica['linhas']}
+            for forma, estatistica in formas.items()
+        ]
+        comandos.sort(key=lambda comando: comando['tempo_ms'], reverse=True)
+        return {
+            'acao': nome,
+            'inicio': datetime.fromtimestamp(inicio, timezone.utc).isoformat(timespec='milliseconds'),
+            'duracao_ms': round(duracao * 1000, 3),
+            'comandos': len(tempos),
+            'tempo_sql_ms': round(sum(tempos) * 1000, 3),
+            'p95_ms': round(percentil(tempos, 95) * 1000, 3),
+            'linhas': sum(comando['linhas'] for comando in comandos),
+            'formas': comandos,
+            'n_mais_1': [comando['sql'] for comando in comandos
+                         if comando['execucoes'] >= self.limite and not comando['sql'].startswith(_CONTROLE_TRANSACAO)],
+            'memoria': memoria,
+        }
+
+    def mostrar(self, resumo, maximo=5):
+        print(f"\n[profile] {resumo['acao']}: {resumo['comandos']} comandos SQL em {resumo['tempo_sql_ms']:.1f} ms "
+              f"(p95 {resumo['p95_ms']:.2f} ms), {resumo['linhas']} linhas lidas, "
+              f"{resumo['duracao_ms']:.1f} ms no total", file=self.saida)
+        if resumo['memoria']:
+            memoria = resumo['memoria']
+            print(f"[profile] Sessão: {memoria['mapa_identidade']} objetos no mapa de identidade ao final "
+                  f"(máximo {memoria['pico_mapa_identidade']}), pico de memória do processo "
+                  f"{memoria['memoria_maxima_kb'] or '?'} KB", file=self.saida)
+        if resumo['formas']:
+            from tabulate import tabulate
+            print(tabulate([[comando['execucoes'], f"{comando['tempo_ms']:.2f}", comando['linhas'],
+                             comando['sql'][:90] + ("..." if len(comando['sql']) > 90 else "")]
+                            for comando in resumo['formas'][:maximo]],
+                           headers=["Execuções", "Tempo (ms)", "Linhas", "Comando"], tablefmt="pretty"),
+                  file=self.saida)
+        for sql in resumo['n_mais_1']:
+            execucoes = next(comando['execucoes'] for comando in resumo['formas'] if comando['sql'] == sql)
+            print(f"[profile] Possível N+1: {execucoes} execuções de {sql[:120]}", file=self.saida)
+
+# Quantidade de operações confirmadas por transação no modo em lote
+LOTE_OPERACOES = 10000
+
+# Operações aceitas no modo em lote, por ação e entidade
+OPERACOES = {
+    'criar': {'genero': criar_genero, 'artista': criar_artista, 'album': criar_album, 'musica': criar_musica},
+    'atualizar': {'genero': atualizar_genero, 'artista': atualizar_artista, 'album': atualizar_album,
+                  'musica': atualizar_musica},
+    'excluir': {'genero': excluir_genero, 'artista': excluir_artista, 'album': excluir_album,
+                'musica': excluir_musica},
+    'consultar': {'genero': consultar_genero, 'artista': consultar_artista, 'album': consultar_album,
+                  'musica': consultar_musica},
+    'excluir_em_massa': {'album': excluir_albuns_em_massa, 'musica': excluir_musicas_em_massa},
+}
+
+# Substitui as referências "$nome" pelos IDs dos registros criados anteriormente no mesmo lote
+def _resolver_referencias(valor, referencias):
+    if isinstance(valor, str) and valor.startswith('$'):
+        if valor[1:] not in referencias:
+            raise LookupError(f"Referência desconhecida: {valor}")
+        return referencias[valor[1:]]
+    if isinstance(valor, list):
+        return [_resolver_referencias(item, referencias) for item in valor]
+    if isinstance(valor, dict):
+        return {chave: _resolver_referencias(item, referencias) for chave, item in valor.items()}
+    return valor
+
+# Função para executar uma operação do lote
+# Formato: {"op": "criar" | "atualizar" | "excluir" | "consultar", "entidade": "genero" | "artista" | "album" |
+# "musica", "id": ..., "dados": {...}, "ref": "nome"}. O campo "ref" de uma criação guarda o ID gerado,
+# que pode ser usado nas operações seguintes como "$nome".
+def executar_operacao(session, operacao, referencias):
+    try:
+        funcao = OPERACOES[operacao['op']][operacao['entidade']]
+    except KeyError:
+        raise ValueError(f"Operação inválida: {operacao.get('op')} {operacao.get('entidade')}") from None
+    argumentos = _resolver_referencias(operacao.get('dados', {}), referencias)
+    if operacao['op'] not in ('criar', 'excluir_em_massa'):
+        argumentos = {**argumentos, f"{operacao['entidade']}_id": _resolver_referencias(operacao['id'], referencias)}
+    resultado = funcao(session, **argumentos)
+    if operacao['op'] == 'criar' and 'ref' in operacao:
+        referencias[operacao['ref']] = resultado.id
+    # Apenas as consultas e as exclusões em massa (com a quantidade excluída) produzem saída
+    if operacao['op'] == 'excluir_em_massa':
+        return {'op': 'excluir_em_massa', 'entidade': operacao['entidade'], 'excluidos': resultado}
+    return resultado if operacao['op'] == 'consultar' else None
+
+# Função para executar um arquivo JSONL de operações em transações de até `tamanho` operações
+# Cada operação roda em um savepoint: uma operação com erro é desfeita e registrada em `erros`
+# (stderr), sem desfazer as demais. Os resultados das consultas são escritos em `saida` como JSONL.
+def run_batch(session, caminho, tamanho=LOTE_OPERACOES, saida=sys.stdout, erros=sys.stderr):
+    totais = {'executadas': 0, 'falhas': 0}
+    referencias = {}
+    pendentes = 0
+    try:
+        with open(caminho, encoding='utf-8') as arquivo:
+            for numero, linha in enumerate(arquivo, start=1):
+                if not linha.strip():
+                    continue
+                try:
+                    with session.begin_nested():
+                        resultado = executar_operacao(session, json.loads(linha), referencias)
+                except (ValueError, LookupError, TypeError, SQLAlchemyError) as erro:
+                    totais['falhas'] += 1
+                    print(f"Linha {numero}: {getattr(erro, 'orig', erro)}", file=erros)
+                    continue
+                if resultado is not None:
+                    print(json.dumps(resultado, ensure_ascii=False), file=saida)
+                totais['executadas'] += 1
+                pendentes += 1
+                if pendentes >= tamanho:
+                    session.commit()
+                    pendentes = 0
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    return totais
+
+# Função para ler os argumentos da linha de comando
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Catálogo musical")
+    parser.add_argument('--perfil-sqlite', choices=sorted(PERFIS_SQLITE), default=PERFIL_PADRAO,
+                        help="perfil de desempenho do SQLite (padrão: %(default)s)")
+    parser.add_argument('--pragma', action='append', default=[], metavar='NOME=VALOR',
+                        help=f"ajusta um PRAGMA do perfil; pode ser repetido ({', '.join(PRAGMAS_AJUSTAVEIS)})")
+    parser.add_argument('--lote', metavar='ARQUIVO',
+                        help="executa as operações de um arquivo JSONL sem o menu interativo")
+    parser.add_argument('--tamanho-transacao', type=int, default=LOTE_OPERACOES, metavar='N',
+                        help="operações confirmadas por transação no modo em lote (padrão: %(default)s)")
+    parser.add_argument('--profile', action='store_true',
+                        help="mede os comandos SQL de cada ação e aponta possíveis N+1")
+    parser.add_argument('--profile-log', metavar='ARQUIVO',
+                        help="grava o resumo de cada ação em JSONL (implica --profile)")
+    parser.add_argument('--versao-esquema', action='store_true',
+                        help="mostra a versão do esquema do banco e as migrações aplicadas e sai")
+    parser.add_argument('--importar', metavar='ARQUIVO', help="importa um arquivo .csv ou .jsonl do catálogo e sai")
+    parser.add_argument('--processos', type=int, default=1, metavar='N',
+                        help="processos da importação; com mais de um, cada processo importa uma parte do arquivo "
+                             "(padrão: %(default)s)")
+    parser.add_argument('--exportar', metavar='DIRETORIO',
+                        help="exporta as músicas (visão completa) e as tabelas do catálogo e sai")
+    parser.add_argument('--formato', choices=sorted(ESCRITORES_EXPORTACAO), default='csv',
+                        help="formato da exportação (padrão: %(default)s; parquet requer o pyarrow)")
+    parser.add_argument('--compressao',
+                        help="compressão da exportação: gzip, bz2 ou xz (CSV/JSONL); snappy, zstd, gzip... (Parquet)")
+    parser.add_argument('--verificar-agregados', action='store_true',
+                        help="verifica a consistência dos agregados e sai (código 1 se houver divergências)")
+    parser.add_argument('--reconstruir-agregados', action='store_true',
+                        help="recalcula os agregados e as estatísticas a partir das músicas e sai")
+    parser.add_argument('--alteracoes', type=int, metavar='CURSOR',
+                        help="grava em JSONL as alterações posteriores ao cursor e sai (o novo cursor vai para a "
+                             "saída de erros)")
+    parser.add_argument('--lote-alteracoes', type=int, default=LOTE_ALTERACOES, metavar='N',
+                        help="alterações lidas por lote (padrão: %(default)s)")
+    parser.add_argument('--compactar-alteracoes', action='store_true',
+                        help="mantém só a alteração mais recente de cada registro e sai")
+    parser.add_argument('--descartar-alteracoes', type=float, metavar='DIAS',
+                        help="descarta as alterações registradas há mais de DIAS dias e sai")
+    args = parser.parse_args(argv)
+    for ajuste in args.pragma:
+        if '=' not in ajuste:
+            parser.error(f"Ajuste inválido: {ajuste} (use NOME=VALOR)")
+    try:
+        args.pragmas = dict(ajuste.split('=', 1) for ajuste in args.pragma)
+        pragmas_perfil(args.perfil_sqlite, args.pragmas)
+    except ValueError as erro:
+        parser.error(str(erro))
+    return args
+
+# Função principal para interação
+def main(argv=None):
+    args = parse_args(argv)
+    instrumentacao = None
+    if args.profile or args.profile_log:
+        # No modo em lote a saída padrão traz os resultados das consultas; o resumo vai para a saída de erros
+        instrumentacao = InstrumentacaoSQL(log=args.profile_log, saida=sys.stderr if args.lote else sys.stdout)
+    engine = setup_database(args.perfil_sqlite, args.pragmas, instrumentacao=instrumentacao)
+
+    # Executa uma ação do menu em uma sessão própria (somente leitura nas telas de consulta), medida quando a
+    # instrumentação está ativa
+    def executar(funcao, *argumentos, somente_leitura=False):
+        with sessao_acao(engine, somente_leitura) as session:
+            if instrumentacao is None:
+                return funcao(session, *argumentos)
+            with instrumentacao.acao(funcao.__name__, session):
+                return funcao(session, *argumentos)
+
+    if args.versao_esquema:
+        with engine.connect() as conexao:
+            print(f"Esquema na versão {versao_esquema(conexao)} (versão do programa: {VERSAO_ESQUEMA}).")
+            aplicadas = conexao.execute(select(versoes_esquema).order_by(versoes_esquema.c.versao)).all()
+        show_table([list(migracao) for migracao in aplicadas], ["Versão", "Migração", "Aplicada em (UTC)"])
+        return 0
+
+    if args.importar:
+        inicio = time.perf_counter()
+        try:
+            if args.processos > 1:
+                totais = executar(import_file_paralelo, args.importar, None, args.processos)
+            else:
+                totais = executar(import_file, args.importar)
+        except (ValueError, KeyError, OSError) as erro:
+            print(f"Erro ao importar o arquivo: {erro}", file=sys.stderr)
+            return 1
+        print(f"Importação concluída em {time.perf_counter() - inicio:.2f} segundos: {totais['artistas']} artistas, "
+              f"{totais['albuns']} álbuns, {totais['musicas']} músicas e {totais['generos']} gêneros cadastrados.",
+              file=sys.stderr)
+        return 0
+
+    if args.exportar:
+        # O cursor é lido na mesma transação da exportação: é o ponto em que a cópia exportada continua
+        def exportar(session):
+            return (export_files(session, args.exportar, args.formato, args.compressao),
+                    cursor_alteracoes(session.connection()))
+
+        inicio = time.perf_counter()
+        try:
+            arquivos, cursor = executar(exportar, somente_leitura=True)
+        except (ValueError, OSError) as erro:
+            print(f"Erro ao exportar o catálogo: {erro}", file=sys.stderr)
+            return 1
+        for nome, linhas in arquivos.items():
+            print(f"{nome}: {linhas} linhas", file=sys.stderr)
+        print(f"Cursor de alterações: {cursor}", file=sys.stderr)
+        print(f"Exportação concluída em {time.perf_counter() - inicio:.2f} segundos.", file=sys.stderr)
+        return 0
+
+    if args.reconstruir_agregados:
+        with engine.begin() as conexao:
+            rebuild_estatisticas(conexao)
+            rebuild_agregados(conexao)
+        print("Agregados reconstruídos.", file=sys.stderr)
+        return 0
+
+    if args.verificar_agregados:
+        with engine.connect() as conexao:
+            divergencias = check_agregados(conexao)
+        for tabela, chaves in divergencias.items():
+            print(f"{tabela}: {len(chaves)} chave(s) divergente(s): {', '.join(map(str, chaves))}", file=sys.stderr)
+        if not divergencias:
+            print("Os agregados estão consistentes.", file=sys.stderr)
+        return 1 if divergencias else 0
+
+    if args.alteracoes is not None:
+        cursor = args.alteracoes
+        try:
+            for itens in percorrer_alteracoes(engine, cursor, args.lote_alteracoes):
+                sys.stdout.writelines(json.dumps(item, ensure_ascii=False) + "\n" for item in itens)
+                cursor = itens[-1]['seq']
+        except ValueError as erro:
+            print(f"Erro ao ler as alterações: {erro}", file=sys.stderr)
+            return 1
+        print(f"Cursor de alterações: {cursor}", file=sys.stderr)
+        return 0
+
+    if args.compactar_alteracoes or args.descartar_alteracoes is not None:
+        with engine.begin() as conexao:
+            removidas = compactar_alteracoes(conexao) if args.compactar_alteracoes else 0
+            if args.descartar_alteracoes is not None:
+                removidas += descartar_alteracoes(conexao, args.descartar_alteracoes)
+        print(f"{removidas} alterações removidas do registro.", file=sys.stderr)
+        return 0
+
+    if args.lote:
+        inicio = time.perf_counter()
+        totais = executar(run_batch, args.lote, args.tamanho_transacao)
+        print(f"{totais['executadas']} operações executadas e {totais['falhas']} com falha "
+              f"em {time.perf_counter() - inicio:.2f} segundos.", file=sys.stderr)
+        return 1 if totais['falhas'] else 0
 
     while True:
         print("\nMenu Principal")
@@ -528,7 +2859,9 @@ def main():
         print("2. Fazer cadastro")
         print("3. Atualizar informações")
         print("4. Excluir informações")
-        print("5. Sair\n")
+        print("5. Buscar no acervo")
+        print("6. Ferramentas")
+        print("7. Sair\n")
         choice = input("Escolha uma opção: ")
 
         if choice == '1':
@@ -542,15 +2875,15 @@ def main():
             sub_choice = input("Escolha uma opção: ")
 
             if sub_choice == '1':
-                show_acervo(session)
+                executar(show_acervo, somente_leitura=True)
             elif sub_choice == '2':
-                show_genero(session)
+                executar(show_genero, somente_leitura=True)
             elif sub_choice == '3':
-                show_artista(session)
+                executar(show_artista, somente_leitura=True)
             elif sub_choice == '4':
-                show_album(session)
+                executar(show_album, somente_leitura=True)
             elif sub_choice == '5':
-                show_musica(session)
+                executar(show_musica, somente_leitura=True)
 
         elif choice == '2':
             print("=" * 30)
@@ -560,22 +2893,51 @@ def main():
             print("4. Cadastrar Música\n")
             sub_choice = input("Escolha uma opção: ")
             if sub_choice == '1':
-                create_genero(session)
+                executar(create_genero)
             elif sub_choice == '2':
-                create_artista(session)
+                executar(create_artista)
             elif sub_choice == '3':
-                create_album(session)
+                executar(create_album)
             elif sub_choice == '4':
-                create_musica(session)
+                executar(create_musica)
 
         elif choice == '3':
-            update_info(session)
+            executar(update_info)
 
         elif choice == '4':
-            delete_info(session)
+            executar(delete_info)
 
         elif choice == '5':
+            executar(search_acervo, somente_leitura=True)
+
+        elif choice == '6':
+            print("=" * 30)
+            print("1. Importar catálogo (CSV/JSONL)")
+            print("2. Verificar planos das consultas")
+            print("3. Estatísticas do catálogo")
+            print("4. Relatório de agregados (álbuns, artistas, gêneros e anos)")
+            print("5. Verificar/reconstruir agregados")
+            print("6. Exportar catálogo (CSV/JSONL/Parquet)")
+            print("7. Registro de alterações (resumo e compactação)\n")
+            sub_choice = input("Escolha uma opção: ")
+            if sub_choice == '1':
+                executar(import_catalogo)
+            elif sub_choice == '2':
+                executar(show_query_plans, somente_leitura=True)
+            elif sub_choice == '3':
+                executar(show_estatisticas, somente_leitura=True)
+            elif sub_choice == '4':
+                executar(show_agregados, somente_leitura=True)
+            elif sub_choice == '5':
+                executar(show_check_agregados)
+            elif sub_choice == '6':
+                executar(export_catalogo, somente_leitura=True)
+            elif sub_choice == '7':
+                executar(show_alteracoes)
+
+        elif choice == '7':
             print("Saindo...")
             break
 
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,286 @@
+import argparse
+import sys
+import time
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import Integer, cast, func, select
+
+from ORMSQLAlchemyv4_final import (Album, Artista, Genero, Musica, artista_musica, PERFIL_PADRAO, PERFIS_SQLITE,
+                                   URL_BANCO, setup_database, show_table, start_session)
+
+# Retrato colunar do catálogo para consultas analíticas
+# Lê as músicas, álbuns, gêneros, artistas e a tabela artista_musica em vetores NumPy compactos (um vetor por
+# coluna, sem objetos do ORM) e responde agrupamentos, agregações e top-k com operações vetorizadas.
+# As ligações artista-música ficam no formato CSR: as posições dos artistas da música i estão em
+# artistas[indptr[i]:indptr[i + 1]]. O retrato é atualizado de forma incremental: as tabelas sem mudanças
+# não são relidas e as que só receberam registros novos leem apenas esses registros.
+
+# Quantidade de linhas lidas do banco por bloco
+LOTE_LEITURA = 50000
+
+# Colunas lidas de cada tabela; a primeira é a chave de ordenação. Valores nulos viram 0 (ou -1 na duração), e
+# anos gravados como texto são convertidos para inteiro (os que não são numéricos contam como sem ano)
+TABELAS_RETRATO = {
+    'generos': (Genero.id,),
+    'artistas': (Artista.id,),
+    'albuns': (Album.id, func.ifnull(cast(Album.ano_lancamento, Integer), 0), cast(Album.coletanea, Integer)),
+    'musicas': (Musica.id, func.coalesce(Musica.album_id, 0), func.coalesce(Musica.genero_id, 0),
+                func.coalesce(Musica.duracao, -1)),
+    'artista_musica': (artista_musica.c.musica_id, artista_musica.c.artista_id),
+}
+
+NOMES_COLUNAS = {
+    'generos': ('id',),
+    'artistas': ('id',),
+    'albuns': ('id', 'ano', 'coletanea'),
+    'musicas': ('id', 'album_id', 'genero_id', 'duracao'),
+    'artista_musica': ('musica_id', 'artista_id'),
+}
+
+# Tabelas usadas para buscar os nomes dos resultados (os nomes não ficam no retrato)
+MODELOS_NOMES = {'genero': Genero, 'artista': Artista, 'album': Album, 'musica': Musica}
+
+AGREGACOES = ('contagem', 'soma', 'media', 'minimo', 'maximo')
+
+# Função para calcular a assinatura de uma tabela: quantidade de linhas, maior chave e uma soma de verificação,
+# também restritas às chaves até `ate` (a maior chave da leitura anterior) para detectar só inclusões
+def assinatura(session, tabela, ate):
+    colunas = TABELAS_RETRATO[tabela]
+    chave = colunas[0]
+    soma = sum((coluna * (2 * indice + 1) for indice, coluna in enumerate(colunas)), start=0)
+    ate = -1 if ate is None else ate
+    linha = session.execute(select(
+        func.count(), func.max(chave), func.coalesce(func.sum(soma), 0),
+        func.count().filter(chave <= ate), func.coalesce(func.sum(soma).filter(chave <= ate), 0),
+    ).select_from(chave.table)).one()
+    return {'linhas': linha[0], 'maximo': linha[1], 'soma': linha[2]}, {'linhas': linha[3], 'soma': linha[4]}
+
+# Função para ler as colunas de uma tabela (a partir de uma chave, se indicada) em um vetor por coluna
+def ler_colunas(session, tabela, apos=None):
+    colunas = TABELAS_RETRATO[tabela]
+    consulta = select(*colunas).order_by(colunas[0])
+    if apos is not None:
+        consulta = consulta.where(colunas[0] > apos)
+    # As linhas vão direto do cursor do driver para os vetores, sem passar pelas linhas do SQLAlchemy
+    conexao = session.connection()
+    sql = str(consulta.compile(conexao, compile_kwargs={'literal_binds': True}))
+    resultado = conexao.exec_driver_sql(sql)
+    blocos = []
+    while linhas := resultado.fetchmany(LOTE_LEITURA):
+        blocos.append(np.fromiter(chain.from_iterable(linhas), dtype=np.int64, count=len(linhas) * len(colunas)))
+    dados = np.concatenate(blocos).reshape(-1, len(colunas)) if blocos else np.empty((0, len(colunas)), np.int64)
+    return {nome: dados[:, indice].copy() for indice, nome in enumerate(NOMES_COLUNAS[tabela])}
+
+class RetratoCatalogo:
+    def __init__(self):
+        self.tabelas = {}
+        self.assinaturas = {}
+
+    # Função para (re)ler as tabelas que mudaram desde a última atualização; devolve o que foi feito com cada uma
+    def atualizar(self, session):
+        # Encerra a transação anterior da sessão para que a leitura veja as gravações feitas desde então
+        session.commit()
+        situacao = {}
+        for tabela in TABELAS_RETRATO:
+            anterior = self.assinaturas.get(tabela)
+            atual, prefixo = assinatura(session, tabela, anterior and anterior['maximo'])
+            if anterior == atual:
+                situacao[tabela] = 'inalterada'
+                continue
+            if anterior and prefixo == {'linhas': anterior['linhas'], 'soma': anterior['soma']}:
+                novas = ler_colunas(session, tabela, apos=anterior['maximo'])
+                self.tabelas[tabela] = {nome: np.concatenate((self.tabelas[tabela][nome], valores))
+                                        for nome, valores in novas.items()}
+                situacao[tabela] = 'incremental'
+            else:
+                self.tabelas[tabela] = ler_colunas(session, tabela)
+                situacao[tabela] = 'recarregada'
+            self.assinaturas[tabela] = atual
+        if any(valor != 'inalterada' for valor in situacao.values()):
+            self._derivar()
+        return situacao
+
+    # Função para montar os vetores derivados: ano e gênero de cada música e a adjacência CSR artista-música
+    def _derivar(self):
+        musicas, albuns = self.tabelas['musicas'], self.tabelas['albuns']
+        generos, artistas = self.tabelas['generos'], self.tabelas['artistas']
+        ligacoes = self.tabelas['artista_musica']
+
+        self.musica_ids = musicas['id']
+        self.duracao = musicas['duracao'].astype(np.int32)
+        self.album_ids = albuns['id']
+        self.album_ano = albuns['ano'].astype(np.int16)
+        self.album_coletanea = albuns['coletanea'].astype(bool)
+        self.genero_ids = generos['id']
+        self.artista_ids = artistas['id']
+
+        # Posição do álbum em album_ids; -1 indica música sem álbum, que fica fora dos agrupamentos por
+        # álbum e por ano
+        posicoes = np.searchsorted(self.album_ids, musicas['album_id'])
+        self.musica_album = np.where(musicas['album_id'] == 0, -1, posicoes).astype(np.int32)
+        self.musicas_com_album = np.flatnonzero(self.musica_album >= 0)
+        self.musica_ano = np.zeros(len(self.musica_ids), dtype=np.int16)
+        self.musica_ano[self.musicas_com_album] = self.album_ano[self.musica_album[self.musicas_com_album]]
+        # Código do gênero: posição em genero_ids mais um; 0 indica música sem gênero
+        codigos = np.searchsorted(self.genero_ids, musicas['genero_id']) + 1
+        self.musica_genero = np.where(musicas['genero_id'] == 0, 0, codigos).astype(np.int32)
+
+        posicoes = np.searchsorted(self.musica_ids, ligacoes['musica_id'])
+        ordem = np.argsort(posicoes, kind='stable')
+        contagens = np.bincount(posicoes, minlength=len(self.musica_ids))
+        self.indptr = np.concatenate(([0], np.cumsum(contagens))).astype(np.int64)
+        self.artistas = np.searchsorted(self.artista_ids, ligacoes['artista_id'][ordem]).astype(np.int32)
+
+    # Memória ocupada pelos vetores do retrato, em bytes
+    def tamanho(self):
+        return sum(valor.nbytes for valor in vars(self).values() if isinstance(valor, np.ndarray))
+
+    # Função para obter, para cada música (ou ligação artista-música), a chave do agrupamento e os valores de
+    # chave possíveis; as chaves de gênero, álbum e artista são devolvidas como IDs. O terceiro valor indica a
+    # música de cada código quando eles não são um por música (ligações, ou só as músicas com álbum).
+    def _chaves(self, por):
+        if por == 'genero':
+            return self.musica_genero, np.concatenate(([0], self.genero_ids)), None
+        if por == 'ano':
+            anos, inverso = np.unique(self.musica_ano[self.musicas_com_album], return_inverse=True)
+            return inverso, anos, self.musicas_com_album
+        if por == 'album':
+            return self.musica_album[self.musicas_com_album], self.album_ids, self.musicas_com_album
+        if por == 'artista':
+            musica_da_ligacao = np.repeat(np.arange(len(self.musica_ids)), np.diff(self.indptr))
+            return self.artistas, self.artista_ids, musica_da_ligacao
+        raise ValueError(f"Agrupamento inválido: {por}")
+
+    # Função para agrupar as músicas e agregar as durações (ou contar as músicas).
+    # Devolve as chaves dos grupos e o valor de cada um; grupos sem músicas não aparecem.
+    def agrupar(self, por, agregacao='contagem'):
+        if agregacao not in AGREGACOES:
+            raise ValueError(f"Agregação inválida: {agregacao}")
+        codigos, chaves, musica_da_ligacao = self._chaves(por)
+        duracao = self.duracao if musica_da_ligacao is None else self.duracao[musica_da_ligacao]
+        grupos = len(chaves)
+        contagem = np.bincount(codigos, minlength=grupos)
+        presentes = contagem > 0
+        if agregacao == 'contagem':
+            return chaves[presentes], contagem[presentes]
+
+        # Músicas sem duração não entram nas somas, médias e extremos
+        validas = duracao >= 0
+        codigos, duracao = codigos[validas], duracao[validas]
+        com_duracao = np.bincount(codigos, minlength=grupos)
+        presentes = com_duracao > 0
+        if agregacao in ('soma', 'media'):
+            soma = np.bincount(codigos, weights=duracao, minlength=grupos)
+            valores = soma if agregacao == 'soma' else soma / np.maximum(com_duracao, 1)
+        else:
+            valores = np.full(grupos, np.iinfo(np.int32).max if agregacao == 'minimo' else -1, dtype=np.int64)
+            (np.minimum if agregacao == 'minimo' else np.maximum).at(valores, codigos, duracao)
+        return chaves[presentes], valores[presentes]
+
+    # Função para o histograma das durações (em segundos, pelas bordas dadas) de cada grupo
+    def histograma(self, bordas, por='genero'):
+        codigos, chaves, musica_da_ligacao = self._chaves(por)
+        duracao = self.duracao if musica_da_ligacao is None else self.duracao[musica_da_ligacao]
+        validas = duracao >= 0
+        faixas = np.digitize(duracao[validas], bordas)
+        contagens = np.bincount(codigos[validas] * (len(bordas) + 1) + faixas,
+                                minlength=len(chaves) * (len(bordas) + 1)).reshape(len(chaves), len(bordas) + 1)
+        presentes = contagens.sum(axis=1) > 0
+        return chaves[presentes], contagens[presentes]
+
+    # Quantidade de álbuns lançados em cada ano (0 indica álbuns sem ano)
+    def lancamentos_por_ano(self, coletanea=None):
+        anos = self.album_ano if coletanea is None else self.album_ano[self.album_coletanea == coletanea]
+        return np.unique(anos, return_counts=True)
+
+# Função para selecionar os k grupos com os maiores valores, em ordem decrescente
+def top_k(chaves, valores, k):
+    k = min(k, len(valores))
+    if k == 0:
+        return chaves[:0], valores[:0]
+    indices = np.argpartition(-valores, k - 1)[:k]
+    indices = indices[np.argsort(-valores[indices], kind='stable')]
+    return chaves[indices], valores[indices]
+
+# Função para buscar no banco os nomes de alguns IDs (os resultados de um top-k ou agrupamento)
+def nomes(session, entidade, ids):
+    modelo = MODELOS_NOMES[entidade]
+    ids = [int(registro_id) for registro_id in ids]
+    encontrados = dict(session.execute(select(modelo.id, modelo.nome).where(modelo.id.in_(ids))).all())
+    return [encontrados.get(registro_id, "(nenhum)") for registro_id in ids]
+
+def carregar_retrato(session):
+    retrato = RetratoCatalogo()
+    retrato.atualizar(session)
+    return retrato
+
+def formatar_duracao(segundos):
+    segundos = int(round(segundos))
+    return f"{segundos // 3600}:{segundos // 60 % 60:02d}:{segundos % 60:02d}"
+
+# Relatórios da linha de comando
+def relatorio_generos(session, retrato, args):
+    bordas = np.array(args.bordas)
+    chaves, contagens = retrato.histograma(bordas, 'genero')
+    rotulos = [f"< {bordas[0]}s"] + [f"{inicio}-{fim}s" for inicio, fim in zip(bordas, bordas[1:])]
+    rotulos.append(f">= {bordas[-1]}s")
+    show_table([[nome, *linha] for nome, linha in zip(nomes(session, 'genero', chaves), contagens.tolist())],
+               ["Gênero", *rotulos])
+
+def relatorio_anos(session, retrato, args):
+    anos, albuns = retrato.lancamentos_por_ano()
+    anos_coletaneas, quantidade_coletaneas = retrato.lancamentos_por_ano(coletanea=True)
+    coletaneas = dict(zip(anos_coletaneas.tolist(), quantidade_coletaneas.tolist()))
+    chaves, musicas = retrato.agrupar('ano')
+    musicas = dict(zip(chaves.tolist(), musicas.tolist()))
+    show_table([[ano or "(sem ano)", total, coletaneas.get(ano, 0), musicas.get(ano, 0)]
+                for ano, total in zip(anos.tolist(), albuns.tolist())],
+               ["Ano", "Álbuns", "Coletâneas", "Músicas"])
+
+def relatorio_albuns(session, retrato, args):
+    chaves, duracoes = top_k(*retrato.agrupar('album', 'soma'), args.top)
+    show_table([[album_id, nome, formatar_duracao(duracao)]
+                for album_id, nome, duracao in zip(chaves.tolist(), nomes(session, 'album', chaves), duracoes)],
+               ["ID", "Álbum", "Duração"])
+
+def relatorio_artistas(session, retrato, args):
+    chaves, quantidades = top_k(*retrato.agrupar('artista'), args.top)
+    show_table([[artista_id, nome, quantidade]
+                for artista_id, nome, quantidade in zip(chaves.tolist(), nomes(session, 'artista', chaves),
+                                                        quantidades.tolist())],
+               ["ID", "Artista", "Músicas"])
+
+RELATORIOS = {
+    'generos': relatorio_generos,
+    'anos': relatorio_anos,
+    'albuns': relatorio_albuns,
+    'artistas': relatorio_artistas,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relatórios analíticos do catálogo musical com um retrato colunar")
+    parser.add_argument('relatorio', choices=sorted(RELATORIOS),
+                        help="generos: histograma das durações por gênero; anos: lançamentos por ano; "
+                             "albuns: álbuns mais longos; artistas: artistas com mais músicas")
+    parser.add_argument('--top', type=int, default=10, help="quantidade de itens nos rankings (padrão: %(default)s)")
+    parser.add_argument('--bordas', type=int, nargs='+', default=[120, 180, 240, 300, 420], metavar='SEGUNDOS',
+                        help="bordas do histograma de durações (padrão: %(default)s)")
+    parser.add_argument('--url', default=URL_BANCO)
+    parser.add_argument('--perfil-sqlite', choices=sorted(PERFIS_SQLITE), default=PERFIL_PADRAO)
+    args = parser.parse_args(argv)
+
+    engine = setup_database(args.perfil_sqlite, url=args.url)
+    session = start_session(engine)
+    try:
+        inicio = time.perf_counter()
+        retrato = carregar_retrato(session)
+        print(f"Retrato carregado em {time.perf_counter() - inicio:.2f} segundos "
+              f"({len(retrato.musica_ids)} músicas, {retrato.tamanho() / 2 ** 20:.1f} MiB).", file=sys.stderr)
+        RELATORIOS[args.relatorio](session, retrato, args)
+    finally:
+        session.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
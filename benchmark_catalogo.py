@@ -0,0 +1,254 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from unittest import mock
+
+import sqlalchemy
+from sqlalchemy import insert
+
+from ORMSQLAlchemyv4_final import (Album, Artista, Genero, Musica, artista_album, artista_musica, PERFIL_PADRAO,
+                                   PERFIS_SQLITE, criar_album, criar_musica, excluir_album, excluir_artista,
+                                   is_database_empty, setup_database, show_acervo, show_musica, start_session)
+
+# Benchmarks do catálogo musical
+# Gera catálogos sintéticos determinísticos (mesma semente, mesmo catálogo) de vários tamanhos e mede os
+# principais caminhos do programa. O resultado sai em JSON para comparar versões (--comparar).
+
+TAMANHOS_PADRAO = [1000, 100000, 1000000]
+
+# Quantidade de registros gravados por transação ao gerar o catálogo
+LOTE_GERACAO = 10000
+
+# Programa medido na inicialização a frio e o tempo máximo aceito para a mediana das inicializações
+PROGRAMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ORMSQLAlchemyv4_final.py')
+ORCAMENTO_INICIALIZACAO_S = 1.0
+
+# Função para gerar um catálogo sintético diretamente nos modelos, em lotes.
+# Os álbuns solo têm um artista (herdado pelas músicas); as faixas das coletâneas têm de um a três artistas.
+def gerar_catalogo(session, musicas, faixas_por_album=10, artistas=None, generos=20, fracao_coletaneas=0.1,
+                   semente=42):
+    aleatorio = random.Random(semente)
+    total_albuns = -(-musicas // faixas_por_album)
+    total_artistas = artistas or max(1, total_albuns // 4)
+
+    session.execute(insert(Genero), [{'id': i, 'nome': f"Gênero {i}"} for i in range(1, generos + 1)])
+    for inicio in range(1, total_artistas + 1, LOTE_GERACAO):
+        session.execute(insert(Artista), [{'id': i, 'nome': f"Artista {i}"}
+                                          for i in range(inicio, min(inicio + LOTE_GERACAO, total_artistas + 1))])
+    session.commit()
+
+    albuns, ligacoes_album, faixas, ligacoes_musica = [], [], [], []
+    musica_id = 0
+    for album_id in range(1, total_albuns + 1):
+        coletanea = aleatorio.random() < fracao_coletaneas
+        albuns.append({'id': album_id, 'nome': f"Álbum {album_id}", 'ano_lancamento': aleatorio.randint(1960, 2024),
+                       'coletanea': coletanea})
+        artista_id = aleatorio.randint(1, total_artistas)
+        if not coletanea:
+            ligacoes_album.append({'artista_id': artista_id, 'album_id': album_id})
+
+        for faixa in range(1, min(faixas_por_album, musicas - musica_id) + 1):
+            musica_id += 1
+            genero_id = aleatorio.randint(1, generos) if aleatorio.random() >= 0.02 else None
+            faixas.append({'id': musica_id, 'nome': f"Música {musica_id}", 'faixa': faixa,
+                           'duracao': aleatorio.randint(90, 480), 'album_id': album_id, 'genero_id': genero_id})
+            autores = (aleatorio.sample(range(1, total_artistas + 1), min(total_artistas, aleatorio.randint(1, 3)))
+                       if coletanea else [artista_id])
+            ligacoes_musica.extend({'artista_id': autor, 'musica_id': musica_id} for autor in autores)
+
+        if len(faixas) >= LOTE_GERACAO or album_id == total_albuns:
+            session.execute(insert(Album), albuns)
+            if ligacoes_album:
+                session.execute(insert(artista_album), ligacoes_album)
+            if faixas:
+                session.execute(insert(Musica), faixas)
+                session.execute(insert(artista_musica), ligacoes_musica)
+            session.commit()
+            albuns, ligacoes_album, faixas, ligacoes_musica = [], [], [], []
+
+    return {'musicas': musica_id, 'albuns': total_albuns, 'artistas': total_artistas, 'generos': generos}
+
+# Função para medir uma função várias vezes; cada repetição recebe o seu índice
+def medir(funcao, repeticoes=1):
+    tempos = []
+    for indice in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(indice)
+        tempos.append(time.perf_counter() - inicio)
+    return {'repeticoes': repeticoes, 'melhor_s': round(min(tempos), 6),
+            'mediana_s': round(statistics.median(tempos), 6), 'total_s': round(sum(tempos), 6)}
+
+# As listagens são interativas: a saída é descartada e as páginas são percorridas até o fim (Enter)
+@contextlib.contextmanager
+def sem_interacao():
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo), \
+            mock.patch('builtins.input', return_value=''):
+        yield
+
+# Função que executa todos os benchmarks em um banco novo com o tamanho pedido
+def executar_tamanho(diretorio, musicas, args):
+    caminho = os.path.join(diretorio, f"benchmark_{musicas}.db")
+    for sufixo in ('', '-wal', '-shm'):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)
+    engine = setup_database(args.perfil_sqlite, url=f"sqlite:///{caminho}")
+
+    session = start_session(engine)
+    inicio = time.perf_counter()
+    catalogo = gerar_catalogo(session, musicas, args.faixas_por_album, args.artistas, args.generos,
+                              args.fracao_coletaneas, args.semente)
+    geracao = round(time.perf_counter() - inicio, 3)
+    session.close()
+
+    tempos = {}
+
+    def em_sessao_nova(nome, funcao, repeticoes):
+        session = start_session(engine)
+        try:
+            tempos[nome] = medir(lambda indice: funcao(session, indice), repeticoes)
+        finally:
+            session.close()
+
+    em_sessao_nova('is_database_empty', lambda session, _: is_database_empty(session), args.repeticoes_rapidas)
+    with sem_interacao():
+        em_sessao_nova('show_acervo', lambda session, _: show_acervo(session), args.repeticoes)
+        em_sessao_nova('show_musica', lambda session, _: show_musica(session), args.repeticoes)
+
+    # Cadastro de um álbum solo com as suas faixas, confirmado em uma transação (o caminho de create_album)
+    def criar(session, indice):
+        album = criar_album(session, f"Álbum de teste {indice}", 2024, False, [1 + indice % catalogo['artistas']])
+        for faixa in range(1, args.faixas_por_album + 1):
+            criar_musica(session, album.id, f"Faixa de teste {faixa}", faixa, 200, 1)
+        session.commit()
+
+    def excluir(funcao, registro_ids):
+        def executar(session, indice):
+            funcao(session, registro_ids[indice])
+            session.commit()
+        return executar
+
+    em_sessao_nova('criar_album', criar, args.operacoes)
+    albuns = random.Random(args.semente).sample(range(1, catalogo['albuns'] + 1), min(args.operacoes, catalogo['albuns']))
+    em_sessao_nova('excluir_album', excluir(excluir_album, albuns), len(albuns))
+    artistas = random.Random(args.semente + 1).sample(range(1, catalogo['artistas'] + 1),
+                                                      min(args.operacoes, catalogo['artistas']))
+    em_sessao_nova('excluir_artista', excluir(excluir_artista, artistas), len(artistas))
+
+    engine.dispose()
+    if not args.manter:
+        for sufixo in ('', '-wal', '-shm'):
+            if os.path.exists(caminho + sufixo):
+                os.remove(caminho + sufixo)
+    return {'catalogo': catalogo, 'geracao_s': geracao, 'tempos': tempos}
+
+# Função para medir a inicialização do programa em processos novos (--versao-esquema abre o banco e sai).
+# A primeira execução cria o banco e aplica as migrações; as seguintes passam só pela leitura do user_version.
+def medir_inicializacao(repeticoes=5):
+    with tempfile.TemporaryDirectory(prefix='benchmark_inicializacao_') as diretorio:
+        def executar(_):
+            subprocess.run([sys.executable, PROGRAMA, '--versao-esquema'], cwd=diretorio, check=True,
+                           stdout=subprocess.DEVNULL)
+        return {'criacao': medir(executar), 'esquema_atual': medir(executar, repeticoes)}
+
+# Função para comparar com um resultado anterior; devolve as medições que ficaram mais lentas que a tolerância
+def comparar(atual, anterior, tolerancia):
+    anteriores = {item['catalogo']['musicas']: item['tempos'] for item in anterior['resultados']}
+    regressoes = []
+    for item in atual['resultados']:
+        base = anteriores.get(item['catalogo']['musicas'], {})
+        for nome, tempo in item['tempos'].items():
+            if nome in base and base[nome]['mediana_s'] > 0:
+                razao = tempo['mediana_s'] / base[nome]['mediana_s']
+                if razao > 1 + tolerancia:
+                    regressoes.append((item['catalogo']['musicas'], nome, round(razao, 2)))
+    return regressoes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do catálogo musical com catálogos sintéticos")
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=TAMANHOS_PADRAO, metavar='MUSICAS',
+                        help="quantidades de músicas dos catálogos gerados (padrão: %(default)s)")
+    parser.add_argument('--faixas-por-album', type=int, default=10)
+    parser.add_argument('--artistas', type=int, help="quantidade de artistas (padrão: um para cada 4 álbuns)")
+    parser.add_argument('--generos', type=int, default=20)
+    parser.add_argument('--fracao-coletaneas', type=float, default=0.1)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--repeticoes', type=int, default=1, help="repetições das listagens (padrão: %(default)s)")
+    parser.add_argument('--repeticoes-rapidas', type=int, default=100,
+                        help="repetições de is_database_empty (padrão: %(default)s)")
+    parser.add_argument('--operacoes', type=int, default=20,
+                        help="álbuns criados e álbuns/artistas excluídos em cada tamanho (padrão: %(default)s)")
+    parser.add_argument('--perfil-sqlite', choices=sorted(PERFIS_SQLITE), default=PERFIL_PADRAO)
+    parser.add_argument('--diretorio', help="onde criar os bancos (padrão: um diretório temporário)")
+    parser.add_argument('--manter', action='store_true', help="mantém os bancos gerados")
+    parser.add_argument('--saida', help="arquivo JSON de resultado (padrão: saída padrão)")
+    parser.add_argument('--comparar', metavar='ANTERIOR', help="resultado JSON anterior para detectar regressões")
+    parser.add_argument('--tolerancia', type=float, default=0.2,
+                        help="aumento relativo da mediana aceito na comparação (padrão: %(default)s)")
+    parser.add_argument('--repeticoes-inicializacao', type=int, default=5,
+                        help="inicializações do programa com o esquema atual (padrão: %(default)s; 0 desativa)")
+    parser.add_argument('--orcamento-inicializacao', type=float, default=ORCAMENTO_INICIALIZACAO_S, metavar='SEGUNDOS',
+                        help="mediana máxima aceita para a inicialização (padrão: %(default)s)")
+    args = parser.parse_args(argv)
+
+    diretorio = args.diretorio or tempfile.mkdtemp(prefix='benchmark_catalogo_')
+    os.makedirs(diretorio, exist_ok=True)
+    resultado = {
+        'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'ambiente': {'python': platform.python_version(), 'sqlalchemy': sqlalchemy.__version__,
+                     'sqlite': sqlite3.sqlite_version, 'plataforma': platform.platform()},
+        'parametros': {'faixas_por_album': args.faixas_por_album, 'artistas': args.artistas, 'generos': args.generos,
+                       'fracao_coletaneas': args.fracao_coletaneas, 'semente': args.semente,
+                       'perfil_sqlite': args.perfil_sqlite},
+        'resultados': [],
+    }
+    if args.repeticoes_inicializacao > 0:
+        print("Inicialização do programa...", file=sys.stderr)
+        resultado['inicializacao'] = medir_inicializacao(args.repeticoes_inicializacao)
+        resultado['inicializacao']['orcamento_s'] = args.orcamento_inicializacao
+        for nome in ('criacao', 'esquema_atual'):
+            print(f"  {nome}: mediana {resultado['inicializacao'][nome]['mediana_s'] * 1000:.2f} ms", file=sys.stderr)
+    for musicas in args.tamanhos:
+        print(f"Catálogo com {musicas} músicas...", file=sys.stderr)
+        item = executar_tamanho(diretorio, musicas, args)
+        resultado['resultados'].append(item)
+        print(f"  geração: {item['geracao_s']} s", file=sys.stderr)
+        for nome, tempo in item['tempos'].items():
+            print(f"  {nome}: mediana {tempo['mediana_s'] * 1000:.2f} ms ({tempo['repeticoes']}x)", file=sys.stderr)
+    if not args.diretorio and not args.manter:
+        os.rmdir(diretorio)
+
+    dados = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(dados + "\n")
+    else:
+        print(dados)
+
+    codigo = 0
+    inicializacao = resultado.get('inicializacao')
+    if inicializacao and inicializacao['esquema_atual']['mediana_s'] > args.orcamento_inicializacao:
+        print(f"Inicialização acima do orçamento: {inicializacao['esquema_atual']['mediana_s']} s "
+              f"(máximo {args.orcamento_inicializacao} s)", file=sys.stderr)
+        codigo = 1
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            regressoes = comparar(resultado, json.load(arquivo), args.tolerancia)
+        for musicas, nome, razao in regressoes:
+            print(f"Regressão: {nome} com {musicas} músicas ficou {razao}x mais lento", file=sys.stderr)
+        if regressoes:
+            codigo = 1
+    return codigo
+
+if __name__ == '__main__':
+    sys.exit(main())
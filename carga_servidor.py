@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+# Teste de carga do servidor do catálogo (servidor_catalogo.py)
+# Abre N clientes com keep-alive que repetem as rotas indicadas durante o tempo pedido e relata
+# requisições por segundo e as latências p50/p90/p99.
+
+ROTAS_PADRAO = ['/musicas?limite=50', '/acervo?limite=10', '/coletaneas?limite=10', '/busca?q=album+1', '/albuns/1']
+
+# Função de um cliente: repete as rotas em sequência na mesma conexão até o fim do teste
+async def cliente(host, porta, rotas, fim, latencias, erros, deslocamento):
+    leitor, escritor = await asyncio.open_connection(host, porta)
+    indice = deslocamento
+    try:
+        while time.perf_counter() < fim:
+            rota = rotas[indice % len(rotas)]
+            indice += 1
+            inicio = time.perf_counter()
+            escritor.write(f"GET {rota} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+            await escritor.drain()
+
+            status = (await leitor.readline()).split()
+            tamanho = 0
+            while True:
+                cabecalho = await leitor.readline()
+                if cabecalho in (b'\r\n', b''):
+                    break
+                nome, _, valor = cabecalho.partition(b':')
+                if nome.strip().lower() == b'content-length':
+                    tamanho = int(valor)
+            await leitor.readexactly(tamanho)
+
+            latencias.append(time.perf_counter() - inicio)
+            if len(status) < 2 or status[1] != b'200':
+                erros[rota] = erros.get(rota, 0) + 1
+    finally:
+        escritor.close()
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    return valores_ordenados[min(len(valores_ordenados) - 1, int(len(valores_ordenados) * p / 100))]
+
+async def executar_carga(host, porta, rotas, clientes, duracao):
+    latencias, erros = [], {}
+    inicio = time.perf_counter()
+    fim = inicio + duracao
+    await asyncio.gather(*(cliente(host, porta, rotas, fim, latencias, erros, i) for i in range(clientes)))
+    decorrido = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        'clientes': clientes,
+        'duracao_s': round(decorrido, 3),
+        'requisicoes': len(latencias),
+        'requisicoes_por_segundo': round(len(latencias) / decorrido, 1),
+        'latencia_ms': {nome: round(percentil(latencias, p) * 1000, 2)
+                        for nome, p in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100))},
+        'erros': erros,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga do servidor do catálogo musical")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8080)
+    parser.add_argument('--clientes', type=int, default=32, help="conexões simultâneas (padrão: %(default)s)")
+    parser.add_argument('--duracao', type=float, default=10.0, help="duração em segundos (padrão: %(default)s)")
+    parser.add_argument('--rota', action='append', dest='rotas', metavar='CAMINHO',
+                        help="rota a requisitar (pode repetir; padrão: uma mistura das rotas do servidor)")
+    parser.add_argument('--json', action='store_true', help="imprime o resultado em JSON")
+    args = parser.parse_args(argv)
+
+    resultado = asyncio.run(executar_carga(args.host, args.porta, args.rotas or ROTAS_PADRAO, args.clientes,
+                                           args.duracao))
+    if args.json:
+        print(json.dumps(resultado, ensure_ascii=False))
+    else:
+        latencia = resultado['latencia_ms']
+        print(f"{resultado['requisicoes']} requisições em {resultado['duracao_s']} s "
+              f"({resultado['requisicoes_por_segundo']} req/s) com {resultado['clientes']} clientes")
+        print(f"Latência (ms): p50 {latencia['p50']} | p90 {latencia['p90']} | p99 {latencia['p99']} "
+              f"| máx {latencia['max']}")
+        if resultado['erros']:
+            print(f"Respostas com erro: {resultado['erros']}")
+    return 1 if resultado['erros'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
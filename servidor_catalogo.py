@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import json
+from itertools import groupby
+from urllib.parse import parse_qs, urlsplit
+
+from sqlalchemy import event, func, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from ORMSQLAlchemyv4_final import (Album, Artista, Genero, Musica, artista_album, artista_musica, CONSULTAS_BUSCA,
+                                   PERFIL_PADRAO, PERFIS_SQLITE, consulta_acervo_artistas, consulta_acervo_coletaneas,
+                                   consulta_listagem_musicas, ler_alteracoes, pragmas_perfil, termo_busca)
+
+# Servidor HTTP/JSON somente leitura sobre o catálogo
+# Usa um engine assíncrono (aiosqlite) com um pool limitado de conexões: cada conexão do aiosqlite roda em
+# sua própria thread e, com o banco em modo WAL, várias leituras são atendidas em paralelo sem bloquear
+# as gravações do programa principal. As conexões são abertas com PRAGMA query_only.
+
+# Endereço padrão do banco para o driver assíncrono
+URL_BANCO_ASSINCRONO = 'sqlite+aiosqlite:///musica_catalogo.db'
+
+# Quantidade de conexões de leitura no pool
+CONEXOES = 8
+
+# Quantidade de itens por página nas respostas (o cliente pode pedir até LIMITE_MAXIMO com ?limite=)
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+
+# Tipos aceitos na busca e os campos de cada resultado
+TIPOS_BUSCA = {
+    'artistas': (Artista, ('id', 'nome')),
+    'albuns': (Album, ('id', 'nome', 'ano_lancamento')),
+    'musicas': (Musica, ('id', 'nome', 'album')),
+}
+
+STATUS = {200: "200 OK", 400: "400 Bad Request", 404: "404 Not Found", 405: "405 Method Not Allowed",
+          500: "500 Internal Server Error"}
+
+# Função para criar o engine assíncrono com o pool limitado e o perfil de desempenho do SQLite
+def criar_engine(url=URL_BANCO_ASSINCRONO, conexoes=CONEXOES, perfil=PERFIL_PADRAO):
+    engine = create_async_engine(url, poolclass=AsyncAdaptedQueuePool, pool_size=conexoes, max_overflow=0)
+    pragmas = pragmas_perfil(perfil)
+
+    @event.listens_for(engine.sync_engine, 'connect')
+    def configurar_conexao(conexao_dbapi, _registro):
+        cursor = conexao_dbapi.cursor()
+        for nome, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nome} = {valor}")
+        cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+    return engine
+
+# Funções auxiliares para ler os parâmetros da URL
+def _inteiro(parametros, nome, padrao=None):
+    valor = parametros.get(nome, [None])[0]
+    if valor is None or valor == '':
+        return padrao
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValueError(f"Parâmetro '{nome}' deve ser um número inteiro") from None
+
+def _limite(parametros):
+    return min(max(_inteiro(parametros, 'limite', LIMITE_PADRAO), 1), LIMITE_MAXIMO)
+
+def _musica(linha):
+    return {'id': linha.musica_id, 'faixa': linha.faixa, 'nome': linha.musica_nome, 'duracao': linha.duracao,
+            'genero': linha.genero_nome}
+
+# GET /acervo?apos=<id do artista>&limite=N
+# Uma página de artistas com seus álbuns e músicas (os dados de show_acervo), em uma única consulta
+async def rota_acervo(conexao, parametros):
+    limite = _limite(parametros)
+    pagina = select(Artista.id).order_by(Artista.id).limit(limite)
+    apos = _inteiro(parametros, 'apos')
+    if apos is not None:
+        pagina = pagina.where(Artista.id > apos)
+    resultado = await conexao.execute(consulta_acervo_artistas().where(Artista.id.in_(pagina)))
+
+    artistas = []
+    for (artista_id, artista_nome), linhas in groupby(resultado, key=lambda linha: (linha.artista_id, linha.artista_nome)):
+        albuns = []
+        for album_id, linhas_album in groupby(linhas, key=lambda linha: linha.album_id):
+            if album_id is None:
+                break
+            linhas_album = list(linhas_album)
+            album = linhas_album[0]
+            albuns.append({'id': album_id, 'nome': album.album_nome, 'ano_lancamento': album.ano_lancamento,
+                           'coletanea': bool(album.coletanea),
+                           'musicas': [_musica(linha) for linha in linhas_album if linha.musica_id is not None]})
+        artistas.append({'id': artista_id, 'nome': artista_nome, 'albuns': albuns})
+    return {'itens': artistas, 'proximo': artistas[-1]['id'] if len(artistas) == limite else None}
+
+# GET /coletaneas?apos=<id do álbum>&limite=N
+async def rota_coletaneas(conexao, parametros):
+    limite = _limite(parametros)
+    pagina = select(Album.id).where(Album.coletanea == True).order_by(Album.id).limit(limite)  # noqa: E712
+    apos = _inteiro(parametros, 'apos')
+    if apos is not None:
+        pagina = pagina.where(Album.id > apos)
+    resultado = await conexao.execute(consulta_acervo_coletaneas().where(Album.id.in_(pagina)))
+
+    albuns = []
+    for album_id, linhas in groupby(resultado, key=lambda linha: linha.album_id):
+        linhas = list(linhas)
+        albuns.append({'id': album_id, 'nome': linhas[0].album_nome, 'ano_lancamento': linhas[0].ano_lancamento,
+                       'musicas': [{**_musica(linha), 'artistas': linha.artistas or ""}
+                                   for linha in linhas if linha.musica_id is not None]})
+    return {'itens': albuns, 'proximo': albuns[-1]['id'] if len(albuns) == limite else None}
+
+# GET /musicas?apos=<id da música>&limite=N
+# A listagem de show_musica, paginada por keyset
+async def rota_musicas(conexao, parametros):
+    limite = _limite(parametros)
+    consulta = consulta_listagem_musicas().limit(limite)
+    apos = _inteiro(parametros, 'apos')
+    if apos is not None:
+        consulta = consulta.where(Musica.id > apos)
+    resultado = await conexao.execute(consulta)
+
+    musicas = [
+        {'id': musica_id, 'nome': nome, 'artistas': artistas or "", 'album_id': album_id, 'album': album_nome,
+         'ano': ano, 'duracao': duracao, 'genero': genero}
+        for musica_id, nome, artistas, album_id, album_nome, ano, duracao, genero in resultado
+    ]
+    return {'itens': musicas, 'proximo': musicas[-1]['id'] if len(musicas) == limite else None}
+
+# GET /busca?q=<texto>&tipo=artistas|albuns|musicas&limite=N
+# Sem tipo, busca nos três; os resultados vêm ordenados por relevância
+async def rota_busca(conexao, parametros):
+    texto = parametros.get('q', [''])[0]
+    termo = termo_busca(texto)
+    if not termo:
+        raise ValueError("Informe o texto da busca em ?q=")
+    tipo = parametros.get('tipo', [None])[0]
+    if tipo is not None and tipo not in TIPOS_BUSCA:
+        raise ValueError(f"Tipo de busca inválido: {tipo}")
+    limite = _limite(parametros)
+
+    resultados = {}
+    for nome_tipo, (entidade, campos) in TIPOS_BUSCA.items():
+        if tipo in (None, nome_tipo):
+            linhas = await conexao.execute(text(CONSULTAS_BUSCA[entidade]), {'termo': termo, 'limite': limite})
+            resultados[nome_tipo] = [dict(zip(campos, linha)) for linha in linhas]
+    return resultados
+
+# GET /albuns/<id>
+# Detalhe de um álbum com seus artistas e músicas (cada uma com gênero e artistas)
+async def rota_album(conexao, album_id):
+    album = (await conexao.execute(
+        select(Album.id, Album.nome, Album.ano_lancamento, Album.coletanea).where(Album.id == album_id))).first()
+    if album is None:
+        raise LookupError(f"Álbum {album_id} não encontrado")
+
+    artistas = await conexao.execute(
+        select(Artista.id, Artista.nome).join(artista_album, artista_album.c.artista_id == Artista.id)
+        .where(artista_album.c.album_id == album_id).order_by(Artista.id))
+    musicas = await conexao.execute(
+        select(Musica.id, Musica.faixa, Musica.nome, Musica.duracao, Genero.nome,
+               func.group_concat(Artista.nome, ', '))
+        .outerjoin(Genero, Genero.id == Musica.genero_id)
+        .outerjoin(artista_musica, artista_musica.c.musica_id == Musica.id)
+        .outerjoin(Artista, Artista.id == artista_musica.c.artista_id)
+        .where(Musica.album_id == album_id)
+        .group_by(Musica.id)
+        .order_by(Musica.faixa, Musica.id))
+
+    return {'id': album.id, 'nome': album.nome, 'ano_lancamento': album.ano_lancamento,
+            'coletanea': bool(album.coletanea),
+            'artistas': [{'id': artista_id, 'nome': nome} for artista_id, nome in artistas],
+            'musicas': [{'id': musica_id, 'faixa': faixa, 'nome': nome, 'duracao': duracao, 'genero': genero,
+                         'artistas': nomes or ""}
+                        for musica_id, faixa, nome, duracao, genero, nomes in musicas]}
+
+# GET /alteracoes?apos=<cursor>&limite=N
+# Registro de alterações para cópias do catálogo: "cursor" é onde a próxima leitura continua (mesmo sem
+# alterações novas) e "proximo" só vem preenchido quando pode haver mais alterações logo em seguida
+async def rota_alteracoes(conexao, parametros):
+    limite = _limite(parametros)
+    apos = _inteiro(parametros, 'apos', 0)
+    itens = await conexao.run_sync(ler_alteracoes, apos, limite)
+    cursor = itens[-1]['seq'] if itens else apos
+    return {'itens': itens, 'cursor': cursor, 'proximo': cursor if len(itens) == limite else None}
+
+ROTAS = {'/acervo': rota_acervo, '/coletaneas': rota_coletaneas, '/musicas': rota_musicas, '/busca': rota_busca,
+         '/alteracoes': rota_alteracoes}
+
+# Função para responder uma requisição: devolve o código de status e o corpo em JSON
+async def responder(engine, metodo, alvo):
+    if metodo != 'GET':
+        return 405, {'erro': "Apenas GET é aceito"}
+    url = urlsplit(alvo)
+    parametros = parse_qs(url.query)
+    try:
+        async with engine.connect() as conexao:
+            if url.path in ROTAS:
+                return 200, await ROTAS[url.path](conexao, parametros)
+            if url.path.startswith('/albuns/') and url.path[len('/albuns/'):].isdigit():
+                return 200, await rota_album(conexao, int(url.path[len('/albuns/'):]))
+            if url.path == '/saude':
+                await conexao.execute(text("SELECT 1"))
+                return 200, {'status': "ok"}
+        return 404, {'erro': f"Rota não encontrada: {url.path}"}
+    except ValueError as erro:
+        return 400, {'erro': str(erro)}
+    except LookupError as erro:
+        return 404, {'erro': str(erro)}
+    except Exception as erro:
+        return 500, {'erro': str(erro)}
+
+# Função que atende uma conexão HTTP/1.1, com suporte a keep-alive
+async def atender(engine, leitor, escritor):
+    try:
+        while True:
+            linha = await leitor.readline()
+            if not linha:
+                break
+            metodo, alvo, versao = linha.decode('latin-1').split()
+            cabecalhos = {}
+            while True:
+                cabecalho = await leitor.readline()
+                if cabecalho in (b'\r\n', b'\n', b''):
+                    break
+                nome, _, valor = cabecalho.decode('latin-1').partition(':')
+                cabecalhos[nome.strip().lower()] = valor.strip()
+            manter = versao == 'HTTP/1.1' and cabecalhos.get('connection', '').lower() != 'close'
+
+            status, corpo = await responder(engine, metodo, alvo)
+            dados = json.dumps(corpo, ensure_ascii=False).encode('utf-8')
+            escritor.write(
+                f"HTTP/1.1 {STATUS[status]}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(dados)}\r\n"
+                f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n".encode('latin-1') + dados)
+            await escritor.drain()
+            if not manter:
+                break
+    except (ConnectionError, ValueError):
+        pass
+    finally:
+        escritor.close()
+
+async def servir(host, porta, engine):
+    servidor = await asyncio.start_server(lambda leitor, escritor: atender(engine, leitor, escritor), host, porta)
+    print(f"Servidor do catálogo em http://{host}:{porta}")
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        await engine.dispose()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor HTTP/JSON somente leitura do catálogo musical")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8080)
+    parser.add_argument('--conexoes', type=int, default=CONEXOES,
+                        help="conexões de leitura no pool (padrão: %(default)s)")
+    parser.add_argument('--url', default=URL_BANCO_ASSINCRONO, help="URL do banco (padrão: %(default)s)")
+    parser.add_argument('--perfil-sqlite', choices=sorted(PERFIS_SQLITE), default=PERFIL_PADRAO)
+    args = parser.parse_args(argv)
+
+    engine = criar_engine(args.url, args.conexoes, args.perfil_sqlite)
+    try:
+        asyncio.run(servir(args.host, args.porta, engine))
+    except KeyboardInterrupt:
+        print("Servidor encerrado.")
+
+if __name__ == '__main__':
+    main()